@@ -0,0 +1,288 @@
+import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import praw
+import prawcore
+
+from enums import ActionStatus
+from logger import logger
+from models.reddit_models import LoggedAction
+from static import ACTION_MAX_TRIES, ACTION_QUEUE_BATCH_SIZE, ACTION_QUEUE_DRAIN_BUDGET_SECS, \
+    ACTION_QUEUE_RETENTION_DAYS, ACTION_QUEUE_WORKERS, ACTION_RETRY_BASE_SECS, ACTION_RETRY_MAX_SECS
+
+# safe to repeat after an interrupted attempt
+IDEMPOTENT_ACTIONS = ("remove",)
+# checked against reddit before being repeated, see run_reply and run_ban
+VERIFIABLE_ACTIONS = ("reply", "ban")
+# everything else (report, message, modmail) is at most once - an interrupted attempt isn't retried
+# the only real ordering between actions: a post's reply goes out once its removal is done. The rest of a post's
+# actions (report, ban, modmail, message) don't depend on each other and run on their own
+DEPENDS_ON = {"reply": "remove"}
+
+PERMANENT_ERRORS = (prawcore.exceptions.Forbidden, prawcore.exceptions.NotFound, prawcore.exceptions.BadRequest)
+
+
+class ActionFailed(Exception):
+    pass
+
+
+def enqueue_action(wd, action_type: str, action_id: str, log_subreddit: str = None, **payload) -> LoggedAction:
+    # (action_type, action_id) is the idempotency key - queueing the same action again is a no-op. log_subreddit
+    # only goes on the LoggedAction row, the executor gets the payload (so subreddit_name= can be one of them)
+    logged_action = wd.s.query(LoggedAction).get({"action_type": action_type, "action_id": action_id})
+    if logged_action:
+        return logged_action
+    logged_action = LoggedAction(log_subreddit, action_type, action_id)
+    logged_action.action_status_enum = ActionStatus.QUEUED
+    logged_action.payload = json.dumps(payload, default=str)
+    logged_action.next_attempt = datetime.now()
+    wd.s.add(logged_action)
+    return logged_action
+
+
+"""EXECUTORS - run on a worker thread: reddit api only, no db session access"""
+def run_remove(ri, payload: dict, verify: bool) -> dict:
+    ri.reddit_client.submission(id=payload["post_id"]).mod.remove()
+    return {}
+
+
+def find_bot_comment(ri, submission):
+    for comment in submission.comments:
+        author = getattr(comment, 'author', None)
+        if author and author.name == ri.bot_name:
+            return comment
+    return None
+
+
+def run_reply(ri, payload: dict, verify: bool) -> dict:
+    submission = ri.reddit_client.submission(id=payload["post_id"])
+    # an earlier attempt may have commented before failing - finish that comment rather than add another
+    comment = find_bot_comment(ri, submission) if verify else None
+    if not comment:
+        # first try to lock thread - useless to make a comment unless it's possible
+        if payload.get("lock_thread"):
+            submission.mod.lock()
+        comment = submission.reply(body=payload["body"])
+        if not comment:
+            raise ActionFailed("reddit did not return the comment")
+    if payload.get("distinguish") or payload.get("sticky"):
+        comment.mod.distinguish(how='yes', sticky=bool(payload.get("sticky")))
+    if payload.get("approve"):
+        comment.mod.approve()
+    return {"comment_id": comment.id}
+
+
+def run_report(ri, payload: dict, verify: bool) -> dict:
+    ri.reddit_client.submission(id=payload["post_id"]).report(payload["reason"][0:99])
+    return {}
+
+
+def run_message(ri, payload: dict, verify: bool) -> dict:
+    ri.reddit_client.redditor(payload["author"]).message(subject=payload["subject"], message=payload["body"])
+    return {}
+
+
+def run_modmail(ri, payload: dict, verify: bool) -> dict:
+    subreddit_api_handle = ri.reddit_client.subreddit(payload["subreddit_name"])
+    if payload.get("thread_id"):
+        try:
+            subreddit_api_handle.modmail(payload["thread_id"]).reply(body=payload["body"], internal=True)
+            return {"conversation_id": payload["thread_id"]}
+        except praw.exceptions.RedditAPIException:
+            pass  # thread is gone, start a new one
+    conversation = subreddit_api_handle.message(subject=payload["subject"], message=payload["body"])
+    return {"conversation_id": getattr(conversation, 'id', None)}
+
+
+def run_ban(ri, payload: dict, verify: bool) -> dict:
+    subreddit_api_handle = ri.reddit_client.subreddit(payload["subreddit_name"])
+    if verify and any(True for _ in subreddit_api_handle.banned(redditor=payload["author"])):
+        return {"already_banned": True}
+    options = {"note": payload["note"], "ban_reason": payload["ban_reason"], "ban_message": payload["ban_message"]}
+    if payload.get("duration"):  # none = permanent
+        options["duration"] = payload["duration"]
+    subreddit_api_handle.banned.add(payload["author"], **options)
+    return {}
+
+
+EXECUTORS: Dict[str, Callable] = {
+    "remove": run_remove,
+    "reply": run_reply,
+    "report": run_report,
+    "message": run_message,
+    "modmail": run_modmail,
+    "ban": run_ban,
+}
+
+
+def run_action(ri, action_type: str, payload: dict, verify: bool) -> dict:
+    if action_type not in EXECUTORS:
+        raise ActionFailed(f"unknown action type {action_type}")
+    return EXECUTORS[action_type](ri, payload, verify)
+
+
+def is_permanent(error: Exception) -> bool:
+    if isinstance(error, PERMANENT_ERRORS + (ActionFailed, KeyError)):
+        return True
+    if isinstance(error, praw.exceptions.RedditAPIException):
+        # "you're doing that too much" is worth retrying, a deleted user or locked thread isn't
+        return not any(item.error_type == "RATELIMIT" for item in error.items)
+    return False
+
+
+"""DRAIN"""
+def recover_interrupted(wd) -> int:
+    # still IN_PROGRESS means the drain that claimed it died (crash, task timeout) before recording the result
+    interrupted = wd.s.query(LoggedAction) \
+        .filter(LoggedAction.action_status_enum == ActionStatus.IN_PROGRESS).all()
+    for logged_action in interrupted:
+        if logged_action.action_type in IDEMPOTENT_ACTIONS + VERIFIABLE_ACTIONS:
+            logged_action.action_status_enum = ActionStatus.QUEUED
+        else:
+            logged_action.action_status_enum = ActionStatus.FAILED
+            logged_action.next_attempt = None
+            logged_action.error_report = "interrupted mid-attempt - not retried in case it went through"
+            logger.warning(f"action queue: not retrying interrupted {logged_action.action_type} "
+                           f"{logged_action.action_id}")
+    wd.s.commit()
+    return len(interrupted)
+
+
+def drain_action_queue(wd, on_done: Callable, on_failed: Callable) -> Counter:
+    """Runs the due actions on a pool of ACTION_QUEUE_WORKERS threads and records the results.
+
+    Each round claims up to ACTION_QUEUE_BATCH_SIZE due actions - marked IN_PROGRESS, try counted, committed
+    before any reddit call - so a drain that dies part way leaves a trail: remove is simply repeated, reply and
+    ban check reddit first, and the rest are given up rather than risk a second modmail or DM. Actions run side
+    by side, except those in DEPENDS_ON: they aren't claimed until the action they follow for the same post is
+    done - they wait behind its retries, and go through on_failed if it fails. The round's outcomes and whatever
+    on_done/on_failed(wd, logged_action, payload, result/error) change are then committed together.
+
+    Follow-ups queued by on_done (a removed post's reply) are due straight away, so rounds continue until nothing
+    is due or ACTION_QUEUE_DRAIN_BUDGET_SECS is spent. Transient errors retry with backoff, doubling from
+    ACTION_RETRY_BASE_SECS, up to ACTION_MAX_TRIES.
+    """
+    counts = Counter()
+    counts["recovered"] = recover_interrupted(wd)
+    tick = datetime.now()
+    executor = wd.worker_pool("actions", ACTION_QUEUE_WORKERS)
+    while datetime.now() - tick < timedelta(seconds=ACTION_QUEUE_DRAIN_BUDGET_SECS):
+        round_counts = drain_round(wd, executor, on_done, on_failed)
+        if not round_counts:
+            break
+        counts.update(round_counts)
+        counts["rounds"] += 1
+    if counts["rounds"]:
+        logger.info(f"action queue: {counts['done']} done, {counts['retry']} to retry, {counts['failed']} failed, "
+                    f"{counts['waiting']} waiting on an earlier action "
+                    f"in {counts['rounds']} round(s), {datetime.now() - tick}; "
+                    f"{counts['recovered']} recovered from an interrupted drain")
+    return counts
+
+
+def find_prerequisite(wd, logged_action: LoggedAction, payload: dict) -> Optional[LoggedAction]:
+    if logged_action.action_type not in DEPENDS_ON or not payload.get("post_id"):
+        return None
+    return wd.s.query(LoggedAction).get({"action_type": DEPENDS_ON[logged_action.action_type],
+                                         "action_id": payload["post_id"]})
+
+
+def claim_due_actions(wd, counts: Counter) -> List[Tuple[LoggedAction, dict, Optional[LoggedAction]]]:
+    # (action, payload, its prerequisite if that failed). An action whose prerequisite is still queued or running
+    # isn't claimed - it's pushed back behind it, so the order holds however many rounds the retries take
+    now = datetime.now()
+    due = wd.s.query(LoggedAction) \
+        .filter(LoggedAction.action_status_enum == ActionStatus.QUEUED, LoggedAction.next_attempt <= now) \
+        .order_by(LoggedAction.next_attempt).limit(ACTION_QUEUE_BATCH_SIZE).all()
+    batch = []
+    for logged_action in due:
+        payload = json.loads(logged_action.payload or "{}")
+        prerequisite = find_prerequisite(wd, logged_action, payload)
+        if prerequisite and prerequisite.action_status_enum in (ActionStatus.QUEUED, ActionStatus.IN_PROGRESS):
+            logged_action.next_attempt = max(prerequisite.next_attempt or now, now) \
+                + timedelta(seconds=ACTION_RETRY_BASE_SECS)
+            counts["waiting"] += 1
+            continue
+        logged_action.action_status_enum = ActionStatus.IN_PROGRESS
+        logged_action.action_try_count += 1
+        logged_action.last_attempt = now
+        failed = prerequisite if prerequisite and prerequisite.action_status_enum == ActionStatus.FAILED else None
+        batch.append((logged_action, payload, failed))
+    wd.s.commit()
+    return batch
+
+
+def drain_round(wd, executor: ThreadPoolExecutor, on_done: Callable, on_failed: Callable) -> Counter:
+    counts = Counter()
+    batch = claim_due_actions(wd, counts)
+    if not batch:
+        return counts
+
+    futures = []
+    for logged_action, payload, failed_prerequisite in batch:
+        if failed_prerequisite:
+            error = ActionFailed(f"{failed_prerequisite.action_type} {failed_prerequisite.action_id} failed")
+            counts[record_failure(wd, logged_action, payload, error, on_failed)] += 1
+            continue
+        # verify: an earlier attempt was started, it may have got through before failing
+        futures.append((logged_action, payload, executor.submit(run_action, wd.ri, logged_action.action_type,
+                                                                 payload, logged_action.action_try_count > 1)))
+
+    for logged_action, payload, future in futures:
+        try:
+            result = future.result()
+        except Exception as e:
+            counts[record_failure(wd, logged_action, payload, e, on_failed)] += 1
+            continue
+        record_done(wd, logged_action, payload, result, on_done)
+        counts["done"] += 1
+    wd.s.commit()  # the whole round's outcomes in one transaction
+    return counts
+
+
+def run_hook(hook: Callable, wd, logged_action: LoggedAction, payload: dict, outcome):
+    # a broken follow-up shouldn't lose the rest of the round's outcomes
+    try:
+        hook(wd, logged_action, payload, outcome)
+    except Exception as e:
+        logger.warning(f"action queue: follow-up for {logged_action.action_type} {logged_action.action_id} "
+                       f"failed: {e}")
+
+
+def record_done(wd, logged_action: LoggedAction, payload: dict, result: dict, on_done: Callable):
+    logged_action.action_status_enum = ActionStatus.DONE
+    logged_action.action_completed = True
+    logged_action.date_actioned = datetime.now()
+    logged_action.next_attempt = None
+    run_hook(on_done, wd, logged_action, payload, result)
+
+
+def record_failure(wd, logged_action: LoggedAction, payload: dict, error: Exception, on_failed: Callable) -> str:
+    logged_action.error_report = f"{type(error).__name__}: {error}"
+    if not is_permanent(error) and logged_action.action_try_count < ACTION_MAX_TRIES:
+        delay = min(ACTION_RETRY_BASE_SECS * 2 ** (logged_action.action_try_count - 1), ACTION_RETRY_MAX_SECS)
+        logged_action.action_status_enum = ActionStatus.QUEUED
+        logged_action.next_attempt = datetime.now() + timedelta(seconds=delay)
+        logger.info(f"action queue: {logged_action.action_type} {logged_action.action_id} try "
+                    f"{logged_action.action_try_count} failed ({logged_action.error_report}), retrying in {delay}s")
+        return "retry"
+    logged_action.action_status_enum = ActionStatus.FAILED
+    logged_action.date_actioned = datetime.now()
+    logged_action.next_attempt = None
+    logger.warning(f"action queue: {logged_action.action_type} {logged_action.action_id} failed after "
+                   f"{logged_action.action_try_count} tr(ies): {logged_action.error_report}")
+    run_hook(on_failed, wd, logged_action, payload, error)
+    return "failed"
+
+
+def purge_action_log(wd):
+    # finished actions only need keeping while something could still queue them again
+    cutoff = datetime.now() - timedelta(days=ACTION_QUEUE_RETENTION_DAYS)
+    wd.s.query(LoggedAction) \
+        .filter(LoggedAction.action_status_enum.in_((ActionStatus.DONE, ActionStatus.FAILED)),
+                LoggedAction.date_actioned < cutoff) \
+        .delete(synchronize_session=False)
+    wd.s.commit()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3.7
+"""Times loading every tracked sub's config the way a cold boot does, before and after the settings_json cache.
+
+Runs reload_yaml_settings over all TrackedSubs three ways: pure python SafeLoader (the old path), libyaml's
+CSafeLoader, and from the cached settings_json. Nothing is written back - the session is rolled back.
+
+Usage:
+
+    python3 benchmark_config_load.py
+"""
+from datetime import datetime
+from unittest import mock
+
+import yaml
+
+import yamlconfig
+from core import dbobj
+from models.reddit_models import TrackedSubreddit
+
+
+def time_reload(trs, label):
+    tick = datetime.now()
+    worked = sum(1 for tr in trs if tr.reload_yaml_settings()[0])
+    print(f"{label}: {len(trs)} subs ({worked} ok) in {datetime.now() - tick}")
+
+
+if __name__ == '__main__':
+    trs = dbobj.s.query(TrackedSubreddit).filter(TrackedSubreddit.settings_yaml_txt.isnot(None)).all()
+    print(f"CSafeLoader available: {yamlconfig.YAML_LOADER is not yaml.SafeLoader}")
+    for tr in trs:
+        tr.settings_json = None
+    with mock.patch.object(yamlconfig, "YAML_LOADER", yaml.SafeLoader):
+        time_reload(trs, "SafeLoader")
+    for tr in trs:
+        tr.settings_json = None
+    time_reload(trs, "CSafeLoader")
+    time_reload(trs, "settings_json")
+    dbobj.s.rollback()
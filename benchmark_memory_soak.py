@@ -0,0 +1,64 @@
+#!/usr/bin/env python3.7
+"""Soak test for session memory: loads posts and hangs praw-sized api_handles on them for thousands of ticks.
+
+"unit" mode runs each tick the way the scheduler does (dbobj session, handles released and session ended after
+the tick). "legacy" keeps one plain session for the whole run like the old global dbobj.s. RSS and identity map size
+are printed every --every ticks, and should stay flat in unit mode.
+
+Usage:
+
+    python3 benchmark_memory_soak.py [ticks] [--legacy] [--every=500]
+
+Needs a database with some RedditPost rows; nothing is written.
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy.orm import sessionmaker
+
+from core import dbobj
+from memory import current_rss_mb, end_of_task
+from models.reddit_models import SubmittedPost
+
+POSTS_PER_TICK = 200
+HANDLE_BYTES = 20000  # about what a fetched praw Submission holds
+
+
+class FakeApiHandle:
+    def __init__(self):
+        self.payload = bytearray(HANDLE_BYTES)
+
+
+def run_tick(session, offset):
+    posts = session.query(SubmittedPost).order_by(SubmittedPost.id).offset(offset).limit(POSTS_PER_TICK).all()
+    for post in posts:
+        post.api_handle = FakeApiHandle()
+    session.commit()
+    return len(posts)
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    ticks = int(args[0]) if args else 5000
+    every = next((int(arg.split("=")[1]) for arg in sys.argv if arg.startswith("--every=")), 500)
+    legacy = "--legacy" in sys.argv
+    legacy_session = sessionmaker(bind=dbobj.engine)() if legacy else None
+    total_posts = dbobj.engine.execute("SELECT COUNT(*) FROM RedditPost").scalar()
+
+    tick = datetime.now()
+    start_rss = current_rss_mb()
+    print(f"{'legacy' if legacy else 'unit'} mode, {ticks} ticks, {total_posts} posts, rss {start_rss:.0f}MB")
+    for j in range(ticks):
+        offset = (j * POSTS_PER_TICK) % max(total_posts, 1)
+        if legacy:
+            run_tick(legacy_session, offset)
+            session_objects = len(legacy_session.identity_map)
+        else:
+            run_tick(dbobj.s, offset)
+            session_objects = len(dbobj.s.identity_map)
+            end_of_task(dbobj.s, "soak tick")
+            dbobj.end_session()
+        if (j + 1) % every == 0:
+            print(f"tick {j + 1}: rss {current_rss_mb():.0f}MB ({current_rss_mb() - start_rss:+.1f}MB), "
+                  f"session objects {session_objects}")
+    print(f"done in {datetime.now() - tick}")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3.7
+"""Per-post memory and construction time: SubmittedPost (ORM) vs SubmissionRecord, from synthetic submissions.
+
+Memory is what tracemalloc sees allocated for the objects themselves (the praw submissions are built first and
+excluded); the ORM objects are transient, no database is touched.
+
+Usage:
+
+    python3 benchmark_submission_record.py [count]
+"""
+import sys
+import tracemalloc
+from datetime import datetime
+
+import praw
+
+from benchmark_bulk_ingest import synthetic_submissions
+from models.reddit_models import SubmissionRecord, SubmittedPost
+
+
+def measure(label, build, submissions):
+    tracemalloc.start()
+    tick = datetime.now()
+    objects = [build(submission) for submission in submissions]
+    elapsed = datetime.now() - tick
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label}: {allocated / len(objects):.0f} bytes/post, "
+          f"{elapsed.total_seconds() * 1000000 / len(objects):.1f}us/post")
+    return objects
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    reddit = praw.Reddit(client_id="benchmark", client_secret="benchmark", user_agent="benchmark")  # no requests
+    submissions = synthetic_submissions(reddit, count, "zr")
+    # SubmittedPost also keeps the submission as api_handle, which isn't counted here since it already exists
+    measure("SubmittedPost", SubmittedPost, submissions)
+    measure("SubmissionRecord", SubmissionRecord.from_submission, submissions)
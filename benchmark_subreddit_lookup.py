@@ -0,0 +1,70 @@
+#!/usr/bin/env python3.7
+"""Times subreddit_name ilike() against exact-match lookups on a seeded copy of RedditPost.
+
+Seeds RedditPostBench (same schema and indexes as RedditPost) with a few million rows, then runs the
+back post / author summary lookup both ways. Drops the table afterwards unless --keep is given.
+
+Usage:
+
+    python3 benchmark_subreddit_lookup.py [rows] [--keep]
+"""
+import random
+import string
+import sys
+from datetime import datetime, timedelta
+from statistics import median
+
+from core import dbobj
+
+BENCH_TABLE = "RedditPostBench"
+SUB_COUNT = 2000
+AUTHOR_COUNT = 200000
+SEED_BATCH = 5000
+RUNS = 50
+
+
+def random_name(length):
+    return "".join(random.choices(string.ascii_lowercase + string.digits, k=length))
+
+
+def seed(rows):
+    dbobj.engine.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    dbobj.engine.execute(f"CREATE TABLE {BENCH_TABLE} LIKE RedditPost")
+    subs = [random_name(12) for _ in range(SUB_COUNT)]
+    authors = [random_name(15) for _ in range(AUTHOR_COUNT)]
+    now = datetime.utcnow()
+    tick = datetime.now()
+    for start in range(0, rows, SEED_BATCH):
+        values = []
+        for i in range(start, min(start + SEED_BATCH, rows)):
+            time_utc = (now - timedelta(minutes=random.randint(0, 60 * 24 * 10))).strftime("%Y-%m-%d %H:%M:%S")
+            values.append(f"('{i:x}', '{random.choice(authors)}', '{random.choice(subs)}', '{time_utc}', "
+                          f"'{time_utc}', '{time_utc}', 0, 0, 0, 'UNKNOWN', 0, 'COUNTS')")
+        dbobj.engine.execute(f"INSERT INTO {BENCH_TABLE} (id, author, subreddit_name, time_utc, last_checked, "
+                             f"last_reviewed, flushed_to_log, nsfw_repliers_checked, is_oc, posted_status, "
+                             f"counted_status, counted_status_enum) VALUES {','.join(values)}")
+    dbobj.engine.execute(f"ANALYZE TABLE {BENCH_TABLE}")
+    print(f"seeded {rows} rows in {datetime.now() - tick}")
+    return dbobj.engine.execute(f"SELECT subreddit_name, author FROM {BENCH_TABLE} "
+                                f"ORDER BY RAND() LIMIT {RUNS}").fetchall()
+
+
+def time_lookup(where, samples):
+    timings = []
+    for subreddit_name, author in samples:
+        tick = datetime.now()
+        dbobj.engine.execute(f"SELECT id FROM {BENCH_TABLE} WHERE {where} AND author = %s "
+                             f"AND time_utc > utc_timestamp() - INTERVAL 72 HOUR", (subreddit_name, author)).fetchall()
+        timings.append((datetime.now() - tick).total_seconds() * 1000)
+    return median(timings), max(timings)
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    samples = seed(int(args[0]) if args else 3000000)
+    # ilike() compiles to lower(col) LIKE lower(param) on mysql
+    for label, where in (("ilike", "lower(subreddit_name) LIKE lower(%s)"), ("equality", "subreddit_name = %s")):
+        med, worst = time_lookup(where, samples)
+        print(f"{label}: median {med:.1f}ms, max {worst:.1f}ms over {len(samples)} lookups")
+    if "--keep" not in sys.argv:
+        dbobj.engine.execute(f"DROP TABLE {BENCH_TABLE}")
@@ -1,19 +1,99 @@
+from contextlib import contextmanager
+
 from settings import DB_ENGINE
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, literal
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from static import DB_MAX_OVERFLOW, DB_POOL_RECYCLE_SECS, DB_POOL_SIZE
 
 
 class Database:
     def __init__(self):
-        self.engine = create_engine(DB_ENGINE)
+        # pre_ping/recycle replace dead connections up front instead of stalling on "server has gone away"
+        pool_args = {}
+        if make_url(DB_ENGINE).get_backend_name() != "sqlite":  # sqlite's pools don't take QueuePool's sizes
+            pool_args = dict(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+        self.engine = create_engine(DB_ENGINE, pool_recycle=DB_POOL_RECYCLE_SECS, pool_pre_ping=True, **pool_args)
         self.Base = declarative_base(bind=self.engine)
-        Session = sessionmaker(bind=self.engine)
-        self.s = Session()
+        # objects outlive their unit of work (sub_dict etc.), so don't expire them on commit
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        # thread-local: every thread using dbobj.s (or wd.s) gets its own session, end it with end_session()
+        self.s = scoped_session(self.Session)
         self.s.rollback()
 
+    def end_session(self):
+        # closes this thread's session and returns its connection to the pool, the next use opens a fresh one
+        self.s.remove()
+
+    @contextmanager
+    def unit_of_work(self):
+        try:
+            yield self.s
+            self.s.commit()
+        except Exception:
+            self.s.rollback()
+            raise
+        finally:
+            self.end_session()
+
     def load_models(self):
         import models.reddit_models
 
         self.Base.metadata.create_all(self.engine)
-        print("Loading database modules")
\ No newline at end of file
+        # create_all only makes missing tables - existing ones need the columns added since they were made
+        self.migrate_columns()
+        print("Loading database modules")
+
+    def migrate_columns(self):
+        # likewise for columns: ALTER TABLE ... ADD for any declared column the live table doesn't have
+        inspector = inspect(self.engine)
+        added = []
+        for table in self.Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                definition = self.column_definition(column)
+                print(f"Adding column {definition} to {table.name}")
+                try:
+                    self.engine.execute(f"ALTER TABLE {table.name} ADD COLUMN {definition}")
+                except SQLAlchemyError as e:
+                    raise RuntimeError(f"{table.name} is missing column {column.name} and it couldn't be added "
+                                       f"({e.__class__.__name__}: {e}) - add it by hand before starting") from e
+                added.append(f"{table.name}.{column.name}")
+        return added
+
+    def column_definition(self, column) -> str:
+        # as create_all would declare it, with the default filling in the rows already there
+        definition = f"{column.name} {column.type.compile(dialect=self.engine.dialect)}"
+        default = None
+        if column.server_default is not None:
+            default = column.server_default.arg
+            default = literal(default) if isinstance(default, str) else default
+        elif column.default is not None and column.default.is_scalar:
+            default = literal(column.default.arg, column.type)
+        if default is not None:
+            definition += " DEFAULT " + str(default.compile(dialect=self.engine.dialect,
+                                                            compile_kwargs={"literal_binds": True}))
+        return definition + (" NULL" if column.nullable else " NOT NULL")
+
+    def migrate_indexes(self):
+        # create_all only makes missing tables, so add any declared index the live table doesn't have yet
+        inspector = inspect(self.engine)
+        created = []
+        for table in self.Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                print(f"Creating index {index.name} on {table.name}")
+                index.create(bind=self.engine)
+                created.append(index.name)
+        return created
\ No newline at end of file
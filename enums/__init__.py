@@ -1,3 +1,4 @@
+from .actionstatus import ActionStatus
 from .countedstatus import CountedStatus
 from .postedstatus import PostedStatus
 from .substatus import SubStatus
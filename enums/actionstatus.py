@@ -0,0 +1,7 @@
+from enum import Enum
+
+class ActionStatus(Enum):
+    QUEUED = "queued"  # waiting for (another) attempt at next_attempt
+    IN_PROGRESS = "in progress"  # claimed by a drain - still set on startup means the drain died mid-action
+    DONE = "done"
+    FAILED = "failed"  # gave up, see error_report
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import threading
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple, Union
+
+import pytz
+
+from enums import CountedStatus, SubStatus
+from logger import logger
+from models.reddit_models import PostingGroup, SubmissionRecord, SubmittedPost, TrackedSubreddit
+
+# same statuses the GROUP BY in look_for_rule_violations3 counts
+COUNTING_STATUSES = (CountedStatus.NEEDS_UPDATE, CountedStatus.NOT_CHKD, CountedStatus.PREV_EXEMPT,
+                     CountedStatus.COUNTS)
+
+
+class FrequencyEngine:
+    """In-memory sliding windows of counted posts per (subreddit, author).
+
+    Posts are pushed as they're ingested. When a push leaves more than max_count_per_interval posts inside the
+    sub's min_post_interval (less grace_period, same boundary the back-post review uses) the author is queued as a
+    candidate PostingGroup, so finding candidates doesn't need the GROUP BY query every minute.
+
+    Every lane that saves posts pushes them here (modmail's spam check runs on the critical lane), so one engine
+    is shared by the task lanes, and locked.
+    """
+
+    def __init__(self):
+        # (subreddit_name, author) -> deque of (time_utc, post_id), oldest first
+        self.windows: Dict[Tuple[str, str], deque] = {}
+        self.candidates: Dict[Tuple[str, str], PostingGroup] = {}
+        self.warmed = False
+        self.lock = threading.RLock()
+
+    def add_post(self, tr_sub: TrackedSubreddit, post: Union[SubmissionRecord, SubmittedPost]):
+        if post.counted_status_enum not in COUNTING_STATUSES or not post.author:
+            return
+        with self.lock:
+            self._add_post(tr_sub, post)
+
+    def _add_post(self, tr_sub: TrackedSubreddit, post: Union[SubmissionRecord, SubmittedPost]):
+        key = (post.subreddit_name, post.author)
+        window = self.windows.setdefault(key, deque())
+        entry = (post.time_utc, post.id)
+        if entry in window:
+            return
+        if not window or window[-1] <= entry:
+            window.append(entry)
+        else:  # arrived out of order (spam queue, warm start) - rare, so a linear insert is fine
+            window.insert(bisect_right(list(window), entry), entry)
+
+        # drop what's fallen out of the interval behind the newest post
+        newest_time = window[-1][0]
+        while window and window[0][0] <= newest_time - tr_sub.min_post_interval:
+            window.popleft()
+
+        # count only what the review would treat as a back post of the newest one
+        boundary = newest_time - tr_sub.min_post_interval + tr_sub.grace_period
+        in_range = sum(1 for time_utc, _ in window if time_utc > boundary) \
+            if tr_sub.grace_period else len(window)
+        if in_range > tr_sub.max_count_per_interval:
+            post_ids = [post_id for _, post_id in window]  # oldest first, like the window
+            self.candidates[key] = PostingGroup(window[-1][1], author_name=post.author,
+                                                subreddit_name=post.subreddit_name, posts=post_ids)
+
+    def discard_post(self, post: SubmittedPost):
+        with self.lock:
+            window = self.windows.get((post.subreddit_name, post.author))
+            if not window:
+                return
+            entry = (post.time_utc, post.id)
+            if entry in window:
+                window.remove(entry)
+
+    def sync_post(self, post: SubmittedPost):
+        # call after a post's counted status changes - exempted/actioned posts stop counting
+        if post.counted_status_enum not in COUNTING_STATUSES:
+            self.discard_post(post)
+
+    def pop_candidates(self) -> List[PostingGroup]:
+        with self.lock:
+            candidates = list(self.candidates.values())
+            self.candidates = {}
+        return candidates
+
+    def prune(self, sub_dict: Dict[str, TrackedSubreddit]):
+        # forget authors whose window has fully expired
+        now = datetime.now(pytz.utc).replace(tzinfo=None)
+        with self.lock:
+            for key in list(self.windows):
+                tr_sub = sub_dict.get(key[0])
+                window = self.windows[key]
+                interval = tr_sub.min_post_interval if tr_sub else timedelta(hours=72)
+                if not window or window[-1][0] <= now - interval:
+                    del self.windows[key]
+
+    def warm_start(self, wd):
+        # rebuild windows from the db on boot; candidates found here match what the sql finder would report
+        tick = datetime.now()
+        longest_interval = max((tr_sub.min_post_interval for tr_sub in wd.sub_dict.values()),
+                               default=timedelta(hours=72))
+        posts = wd.s.query(SubmittedPost.id, SubmittedPost.author, SubmittedPost.subreddit_name,
+                           SubmittedPost.time_utc, SubmittedPost.counted_status_enum) \
+            .filter(SubmittedPost.time_utc > datetime.now(pytz.utc).replace(tzinfo=None) - longest_interval,
+                    SubmittedPost.counted_status_enum.in_(COUNTING_STATUSES)) \
+            .order_by(SubmittedPost.time_utc).all()
+        count = 0
+        for post in posts:
+            tr_sub = wd.sub_dict.get(post.subreddit_name)
+            if not tr_sub or tr_sub.active_status_enum not in (SubStatus.ACTIVE, SubStatus.NO_BAN_ACCESS):
+                continue
+            if post.time_utc <= datetime.now(pytz.utc).replace(tzinfo=None) - tr_sub.min_post_interval:
+                continue
+            self.add_post(tr_sub, post)
+            count += 1
+        self.warmed = True
+        logger.info(f"frequency engine warm start: {count} posts, {len(self.windows)} authors, "
+                    f"{len(self.candidates)} candidates in {datetime.now() - tick}")
+
+    def compare_with_sql(self, sql_keys, engine_keys):
+        # shadow mode: log where the two candidate finders disagree
+        only_sql = set(sql_keys) - set(engine_keys)
+        only_engine = set(engine_keys) - set(sql_keys)
+        logger.info(f"frequency engine shadow: sql={len(set(sql_keys))} engine={len(set(engine_keys))} "
+                    f"only_sql={len(only_sql)} only_engine={len(only_engine)}")
+        for subreddit_name, author in only_sql:
+            logger.debug(f"\tsql only: r/{subreddit_name} u/{author}")
+        for subreddit_name, author in only_engine:
+            logger.debug(f"\tengine only: r/{subreddit_name} u/{author}")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3.7
+"""Adds the declared RedditPost indexes to a live database, then EXPLAINs the hot queries.
+
+Declared columns missing from live tables (e.g. the LoggedActions queue columns) are added first - the bot also
+does this itself at startup (Database.load_models).
+
+Also lowercases any subreddit_name stored before it was normalized, so the exact-match lookups find them.
+Safe to re-run: indexes that already exist are skipped and the backfill only touches mixed-case rows.
+
+Usage:
+
+    python3 index_migration.py            # migrate, then report
+    python3 index_migration.py --report   # report only
+"""
+import sys
+
+from core import dbobj
+
+# the hot RedditPost lookups, written out with representative parameters
+HOT_QUERIES = {
+    "back posts (utils.check_for_actionable_violations)":
+        "SELECT id FROM RedditPost WHERE subreddit_name = 'test' AND author = 'test' "
+        "AND time_utc > utc_timestamp() - INTERVAL 72 HOUR "
+        "AND counted_status_enum IN ('NEEDS_UPDATE', 'NOT_CHKD', 'COUNTS') ORDER BY time_utc",
+    "status updates (utils.do_reddit_actions)":
+        "SELECT id FROM RedditPost WHERE counted_status_enum = 'NEEDS_UPDATE' "
+        "AND time_utc > utc_timestamp() - INTERVAL 48 HOUR",
+    "removals (utils.do_reddit_actions)":
+        "SELECT id FROM RedditPost WHERE counted_status_enum IN ('BLKLIST_NEED_REMOVE', 'NEED_REMOVE') "
+        "AND time_utc > utc_timestamp() - INTERVAL 24 HOUR",
+    "leftover groups (utils.look_for_rule_violations3)":
+        "SELECT id FROM RedditPost WHERE reviewed = 0 AND counted_status_enum IN ('NEEDS_UPDATE', 'NOT_CHKD') "
+        "AND review_debug LIKE 'ma:%' AND time_utc > utc_timestamp() - INTERVAL 48 HOUR ORDER BY added_time DESC",
+    "last identified group (utils.look_for_rule_violations3)":
+        "SELECT id FROM RedditPost WHERE review_debug LIKE 'ma:%' ORDER BY added_time LIMIT 1",
+    "frequency candidates (utils.look_for_rule_violations3)":
+        "SELECT MAX(t.id), COUNT(t.author) FROM RedditPost t INNER JOIN TrackedSubs s "
+        "ON t.subreddit_name = s.subreddit_name WHERE s.active_status_enum IN ('ACTIVE', 'NO_BAN_ACCESS') "
+        "AND counted_status_enum IN ('NEEDS_UPDATE', 'NOT_CHKD', 'PREV_EXEMPT', 'COUNTS') "
+        "AND t.time_utc > utc_timestamp() - INTERVAL s.min_post_interval_mins MINUTE "
+        "GROUP BY t.author, t.subreddit_name HAVING COUNT(t.author) > s.max_count_per_interval",
+    "blacklist (utils.automated_reviews)":
+        "SELECT t.id FROM RedditPost t INNER JOIN SubAuthors a "
+        "ON a.author_name = t.author AND a.subreddit_name = t.subreddit_name "
+        "WHERE t.reviewed = 0 AND t.time_utc < a.next_eligible AND t.time_utc > utc_timestamp() - INTERVAL 24 HOUR",
+    "strict sfw (nsfw_monitoring.nsfw_checking)":
+        "SELECT id FROM RedditPost WHERE post_flair LIKE '%strict sfw%' "
+        "AND time_utc > utc_timestamp() - INTERVAL 36 HOUR "
+        "AND counted_status_enum IN ('NEEDS_UPDATE', 'NOT_CHKD', 'PREV_EXEMPT', 'REVIEWED') ORDER BY time_utc DESC",
+    "purge (main.purge_old_records)":
+        "SELECT t.id FROM RedditPost t INNER JOIN TrackedSubs s ON t.subreddit_name = s.subreddit_name "
+        "WHERE t.time_utc < utc_timestamp() - INTERVAL greatest(s.min_post_interval_mins, 60*24*10) MINUTE "
+        "AND t.flagged_duplicate = 0 AND t.pre_duplicate = 0",
+    "response stats (main.calculate_stats)":
+        "SELECT count(*), subreddit_name, date(time_utc) AS date FROM RedditPost "
+        "WHERE time_utc > utc_timestamp() - INTERVAL 60*24*14 MINUTE AND response_time IS NOT NULL "
+        "GROUP BY subreddit_name, date",
+}
+
+
+def normalize_subreddit_names(batch_size=10000):
+    # BINARY so the comparison is case sensitive under the default collation
+    total = 0
+    while True:
+        rs = dbobj.engine.execute("UPDATE RedditPost SET subreddit_name = LOWER(subreddit_name) "
+                                  f"WHERE BINARY subreddit_name <> LOWER(subreddit_name) LIMIT {batch_size}")
+        total += rs.rowcount
+        if rs.rowcount < batch_size:
+            break
+    print(f"Lowercased subreddit_name on {total} post(s)")
+    return total
+
+
+def explain_report():
+    for name, statement in HOT_QUERIES.items():
+        print(f"\n{name}")
+        rs = dbobj.engine.execute(f"EXPLAIN {statement}")
+        columns = list(rs.keys())
+        for row in rs:
+            row = dict(zip(columns, row))
+            if row.get('table') not in ('t', 'RedditPost'):
+                continue
+            print(f"\ttype={row.get('type')} key={row.get('key')} rows={row.get('rows')} extra={row.get('Extra')}")
+
+
+if __name__ == '__main__':
+    if "--report" not in sys.argv:
+        normalize_subreddit_names()
+        added = dbobj.migrate_columns()
+        print(f"Added {len(added)} column(s): {', '.join(added) or 'none'}")
+        created = dbobj.migrate_indexes()
+        print(f"Created {len(created)} index(es): {', '.join(created) or 'none'}")
+    explain_report()
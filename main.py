@@ -5,6 +5,7 @@ from __future__ import annotations
 # from praw.models import Submission
 from static import *
 from datetime import datetime, timedelta, timezone
+from collections import Counter
 # from typing import List
 # import praw
 import prawcore
@@ -12,13 +13,19 @@ import pytz
 from settings import MAIN_BOT_NAME, ACCEPTING_NEW_SUBS, BOT_OWNER
 from utils import look_for_rule_violations3
 from models.reddit_models import ActionedComments, CommonPost, Stats2, SubAuthor, SubmittedPost, TrackedAuthor, \
-    TrackedSubreddit, RedditInterface
+    TrackedSubreddit, RedditInterface, AsyncRedditInterface
 # from logger import logger
 from core import dbobj
 from workingdata import WorkingData
 from nsfw_monitoring import check_post_nsfw_eligibility, nsfw_checking
 from modmail import handle_modmail_message, handle_modmail_messages, handle_dm_command, handle_direct_messages
-from utils import check_spam_submissions, check_new_submissions, do_reddit_actions
+from utils import check_spam_submissions, check_new_submissions, do_reddit_actions, fetch_new_submissions, \
+    fetch_spam_submissions, ingest_new_submissions, ingest_spam_submissions, config_check_due, refresh_sub_config
+from frequency_engine import FrequencyEngine
+from partitioning import purge_partitions
+from purge import ChunkedPurge
+from actionqueue import purge_action_log
+from scheduler import ScheduledTask, Scheduler, run_lanes
 
 
 from logger import logger as log
@@ -39,81 +46,12 @@ add non-binary gender
 
 """
 
-class Task:
-    """
-    __tablename__ = 'Tasks'
-    wd = None
-    task_name = Column(String(191), nullable=False, primary_key=True)
-    func_name = Column(String(191), nullable=False)
-    last_run_dt = Column(DateTime, nullable=True)
-    last_runtime = Column(Integer, nullable=False)
-    frequency_mins = Column(Integer, nullable=False)
-    last_error
-    time out?
-
-    """
-
-    wd = None
-    target_function = None
-    last_run_dt = None
-    frequency = timedelta(minutes=5)
-    max_duration = timedelta(minutes=5)
-    task_durations = []
-    error_count = 0
-    last_error = ""
-
-    def __init__(self, wd, target_function, frequency):
-        self.wd = wd
-        self.target_function = target_function
-        self.frequency = frequency
-
-    def run_task(self):
-
-        if self.last_run_dt and self.last_run_dt + self.frequency > datetime.now():
-            log.debug(f"Skipping task as not due for task: {self.target_function}")
-            pass
-        elif self.error_count > 5 and self.last_run_dt > datetime.now()-timedelta(hours=5):
-            # if had multiple erros  and last ran less than five hours ago
-            log.debug(f"Skipping task due to previous errors: {self.target_function} {self.last_error}")
-        else:
-            start_time = datetime.now()
-            try:
-                log.debug(f"Running task: {self.target_function}, last ran:{self.last_run_dt}")
-                globals()[self.target_function](self.wd)
-                end_time = datetime.now()
-                self.last_run_dt = start_time
-                log.debug(f"Task complete {self.target_function} {end_time-start_time}")
-                self.task_durations.append((end_time-start_time).seconds)
-            except (prawcore.exceptions.ServerError, prawcore.exceptions.ResponseException):
-                self.wd.s.commit()
-                self.error_count += 1
-                import traceback
-                trace = traceback.format_exc()
-                print(trace)
-                return -1
-            except Exception:
-                self.wd.s.commit()
-                import traceback
-                trace = traceback.format_exc()
-                self.last_error = str(trace)
-                print(trace)
-
-        """
-        except (prawcore.exceptions.ServerError, prawcore.exceptions.ResponseException) as e:
-            import time
-            print("sleeping due to server error")
-            import traceback
-            print(traceback.format_exc())
-            time.sleep(60 * 5)  # sleep for a bit server errors
-        
-            import traceback
-            trace = traceback.format_exc()
-            print(trace)
-            # wd.ri.send_modmail(subreddit_name=BOT_NAME, subject="[Notification] MHB Exception", body=trace,
-            #                    use_same_thread=True)
-            #wd.s.add(wd.ri.bot_sub)
-            #wd.s.commit()
-        """
+def fetch_submission_chunk(wd, sub_list_str):
+    # runs on a worker thread: reddit api only, no db session access
+    tick = datetime.now()
+    new_posts, subs_complete = fetch_new_submissions(wd, sub_list=sub_list_str, intensity=0)
+    spam_posts = fetch_spam_submissions(wd, sub_list=sub_list_str)
+    return new_posts, subs_complete, spam_posts, datetime.now() - tick
 
 
 def check_submissions(wd):
@@ -122,29 +60,85 @@ def check_submissions(wd):
     wd.sub_list = list(wd.sub_dict.keys())
     chunked_list = [wd.sub_list[j:j + chunk_size] for j in range(0, len(wd.sub_list), chunk_size)]
 
-    for sub_list in chunked_list:
-        sub_list_str = "+".join(sub_list)
-        check_new_submissions(wd, sub_list=sub_list_str, intensity=0)
-        check_spam_submissions(wd, sub_list=sub_list_str, intensity=0)
+    if CHECK_SUBMISSIONS_WORKERS <= 1:
+        for j, sub_list in enumerate(chunked_list):
+            tick = datetime.now()
+            sub_list_str = "+".join(sub_list)
+            check_new_submissions(wd, sub_list=sub_list_str, intensity=0)
+            check_spam_submissions(wd, sub_list=sub_list_str, intensity=0)
+            log.debug(f"chunk {j + 1}/{len(chunked_list)}: {datetime.now() - tick}")
+        return
+
+    # Listings are fetched concurrently (each worker with its own praw client, all on the one rate limiter),
+    # db writes stay on this thread and this session
+    executor = wd.worker_pool("fetch", CHECK_SUBMISSIONS_WORKERS)
+    futures = [executor.submit(fetch_submission_chunk, wd, "+".join(sub_list)) for sub_list in chunked_list]
+    for j, future in enumerate(futures):
+        new_posts, subs_complete, spam_posts, fetch_time = future.result()
+        tick = datetime.now()
+        ingest_new_submissions(wd, new_posts, subs_complete, intensity=0, sub_list="+".join(chunked_list[j]))
+        ingest_spam_submissions(wd, spam_posts, intensity=0)
+        log.debug(f"chunk {j + 1}/{len(chunked_list)}: fetch {fetch_time}, db {datetime.now() - tick}")
+
+
+def lane_working_data(wd: WorkingData) -> WorkingData:
+    # shares the reddit interface (praw clients are per thread), but has its own copies of the subs (dbobj.s is per thread already)
+    lane_wd = WorkingData()
+    lane_wd.s = dbobj.s
+    lane_wd.ri = wd.ri
+    lane_wd.bot_name = wd.bot_name
+    lane_wd.most_recent_review = None
+    lane_wd.sub_dict = {}
+    lane_wd.nsfw_monitoring_subs = {}
+    return lane_wd
+
+
+def reload_sub_list(wd: WorkingData):
+    # sub list from the db only - update_sub_list in the bulk lane does the wiki/api refreshes
+    update_sub_list(wd, refresh_configs=False)
+
 
 def main_loop():
     wd: WorkingData = WorkingData()
-    wd.s = dbobj.s  # Database Session object
+    wd.s = dbobj.s  # Database Session - thread-local, ended after every task by the scheduler
     wd.ri = RedditInterface()  # Reddit API instance
     wd.most_recent_review = None  # not used?
     wd.bot_name = wd.ri.reddit_client.user.me().name  # what is my name?
     log.debug(f"My name is {wd.bot_name}")
 
-    tasks = [Task(wd, 'purge_old_records', timedelta(hours=12)),
-             Task(wd, 'do_reddit_actions', timedelta(minutes=1)),
-             Task(wd, 'update_sub_list', timedelta(hours=2)),
-             Task(wd, 'handle_direct_messages', timedelta(minutes=1)),
-             Task(wd, 'handle_modmail_messages', timedelta(minutes=1)),
-             Task(wd, 'look_for_rule_violations3', timedelta(minutes=1)),
-             Task(wd, 'check_submissions', timedelta(minutes=1)),
-             Task(wd, 'calculate_stats', timedelta(hours=10)),
-             Task(wd, 'nsfw_checking', timedelta(minutes=20)),
-             ]
+    # latency-critical lane keeps the original wd
+    ingest_wd = lane_working_data(wd) if TASK_LANES else wd
+    bulk_wd = lane_working_data(wd) if TASK_LANES else wd
+    if REDDIT_BACKEND == "async":
+        wd.ari = AsyncRedditInterface(status_cache=wd.ri.status_cache)  # concurrent Reddit API calls, only used from this lane's thread
+    if FREQUENCY_ENGINE_MODE != "off":
+        # one for all lanes, so posts saved on any of them count - warm started on first look_for_rule_violations3
+        wd.frequency_engine = ingest_wd.frequency_engine = bulk_wd.frequency_engine = FrequencyEngine()
+    chunked_purge = PURGE_MODE == "chunked" and not REDDITPOST_PARTITIONING
+    if chunked_purge:
+        bulk_wd.purge_job = ChunkedPurge()
+
+    # the chunked purge does a little every tick and paces its own passes
+    purge_frequency = timedelta(minutes=1) if chunked_purge else timedelta(hours=PURGE_INTERVAL_HRS)
+    critical_tasks = [
+        ScheduledTask('do_reddit_actions', do_reddit_actions, timedelta(minutes=1), timedelta(minutes=5)),
+        ScheduledTask('handle_direct_messages', handle_direct_messages, timedelta(minutes=1), timedelta(minutes=5)),
+        ScheduledTask('handle_modmail_messages', handle_modmail_messages, timedelta(minutes=1),
+                      timedelta(minutes=5)),
+    ]
+    ingest_tasks = [
+        ScheduledTask('check_submissions', check_submissions, timedelta(minutes=1), timedelta(minutes=5)),
+        ScheduledTask('look_for_rule_violations3', look_for_rule_violations3, timedelta(minutes=1),
+                      timedelta(minutes=10)),
+    ]
+    bulk_tasks = [
+        ScheduledTask('purge_old_records', purge_old_records, purge_frequency, timedelta(minutes=30)),
+        ScheduledTask('update_sub_list', update_sub_list, timedelta(hours=2), timedelta(minutes=30)),
+        ScheduledTask('refresh_sub_configs', refresh_sub_configs, timedelta(minutes=CONFIG_REFRESH_INTERVAL_MINS),
+                      timedelta(minutes=10)),
+        ScheduledTask('calculate_stats', calculate_stats, timedelta(hours=10), timedelta(minutes=30)),
+        ScheduledTask('nsfw_checking', nsfw_checking, timedelta(minutes=20), timedelta(minutes=5)),
+    ]
     if False:
         purge_old_records(wd)
         update_sub_list(wd)
@@ -158,56 +152,64 @@ def main_loop():
         #  do_automated_replies()  This is currently disabled!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 
         # nsfw_checking(wd)
-    rate_limiting_errors = 0
-    while True:
+    # what each task gets of the reddit rate limit - same split as the lanes, so it holds in serial mode too
+    for priority, tasks in (("critical", critical_tasks), ("ingest", ingest_tasks), ("bulk", bulk_tasks)):
         for task in tasks:
-            return_val = task.run_task()
-            if return_val == -1:
-                rate_limiting_errors += 1
-                if rate_limiting_errors > 2:
-                    import time
-                    time.sleep(60 * 5)
-                    rate_limiting_errors = 0
-
-
-def update_sub_list(wd: WorkingData, intensity=0):
+            task.priority = priority
+
+    # update_sub_list may not be due yet after a restart, so every lane loads the sub list as it starts
+    if not TASK_LANES:
+        run_lanes([Scheduler(wd, critical_tasks + ingest_tasks + bulk_tasks, on_start=reload_sub_list)])
+        return
+
+    # other lanes pick up sub list and config changes from the db as often as the bulk lane refreshes them
+    critical_tasks.append(ScheduledTask('reload_sub_list:critical', reload_sub_list,
+                                        timedelta(minutes=CONFIG_REFRESH_INTERVAL_MINS), timedelta(minutes=5)))
+    ingest_tasks.append(ScheduledTask('reload_sub_list:ingest', reload_sub_list,
+                                      timedelta(minutes=CONFIG_REFRESH_INTERVAL_MINS), timedelta(minutes=5)))
+    run_lanes([Scheduler(wd, critical_tasks, "critical", timedelta(seconds=LANE_DEADLINES_SECS["critical"]),
+                         on_start=reload_sub_list),
+               Scheduler(ingest_wd, ingest_tasks, "ingest", timedelta(seconds=LANE_DEADLINES_SECS["ingest"]),
+                         on_start=reload_sub_list),
+               Scheduler(bulk_wd, bulk_tasks, "bulk", timedelta(seconds=LANE_DEADLINES_SECS["bulk"]),
+                         on_start=reload_sub_list)])
+
+
+def update_sub_list(wd: WorkingData, intensity=0, refresh_configs=True):
     log.info('updating subs..')
     wd.nsfw_monitoring_subs = {}
 
-    trs = wd.s.query(TrackedSubreddit)\
+    # populate_existing: subs kept in sub_dict aren't expired between tasks, so pick up changes made elsewhere
+    trs = wd.s.query(TrackedSubreddit).populate_existing()\
         .filter(~TrackedSubreddit.active_status_enum.in_((SubStatus.SUB_FORBIDDEN, SubStatus.SUB_GONE))).all()
 
     # go through all subs in database
     for tr in trs:
         assert isinstance(tr, TrackedSubreddit)
 
-        # See if due for complete re-pull from subreddit wiki (do periodically)
-        if not tr.config_last_checked\
-                or (tr.config_last_checked < datetime.now() - timedelta(days=1))\
-                or (not tr.mod_list)\
-                or (intensity == 3):
+        # See if due for a re-pull from subreddit wiki (jittered per sub, skipped if the page hasn't changed)
+        if refresh_configs and config_check_due(tr, intensity):
             log.debug(f'***** rechecking...{tr.subreddit_name}, {tr.active_status_enum}'
                   f' last updated:{tr.last_updated} last config check:{tr.config_last_checked}')
-
-            sub_info = wd.ri.get_subreddit_info(tr.subreddit_name)
-            tr.update_from_subinfo(sub_info)  # repopulate db with new values/settings from sub
-            tr.config_last_checked = datetime.now()  # record this is updated
-            wd.s.add(tr)
-        if wd.ri.bot_name.lower() == "moderatelyhelpfulbot" and "moderatelyusefulbot" in tr.mod_list.lower():
+            refresh_sub_config(wd, tr, full=intensity == 3)
+        if wd.ri.bot_name.lower() == "moderatelyhelpfulbot" and tr.mod_list \
+                and "moderatelyusefulbot" in tr.mod_list.lower():
             tr.active_status_enum = SubStatus.BOT_NOT_PRIMARY
             wd.s.add(tr)
 
         # skip adding  if config is NOT okay
         if tr.active_status_enum in (SubStatus.YAML_SYNTAX_ERROR, SubStatus.NO_CONFIG, SubStatus.CONFIG_ACCESS_ERROR, SubStatus.BOT_NOT_PRIMARY):
             log.info(f" active status for {tr.subreddit_name} is {tr.active_status_enum},  skipping")
+            wd.sub_dict.pop(tr.subreddit_name, None)  # loaded before its config broke
             continue  # don't bother with this
 
-        # Attempt to load config assuming it's okay
-        if tr.subreddit_name not in wd.sub_dict:
+        # Attempt to load config assuming it's okay - again if it changed since this lane loaded it
+        if tr.subreddit_name not in wd.sub_dict or tr.config_changed():
             worked, status = tr.reload_yaml_settings()
             wd.s.add(tr)
             if not worked:
                 log.info(f" active status for {tr.subreddit_name} is {tr.active_status_enum},  skipping")
+                wd.sub_dict.pop(tr.subreddit_name, None)
                 continue
 
         # Add sub to dict to check
@@ -223,7 +225,39 @@ def update_sub_list(wd: WorkingData, intensity=0):
 
 
 
+def refresh_sub_configs(wd: WorkingData):
+    # a slice of the day's config checks every run: just the subs whose jittered config_next_check has passed
+    tick = datetime.now()
+    trs = wd.s.query(TrackedSubreddit)\
+        .filter(~TrackedSubreddit.active_status_enum.in_((SubStatus.SUB_FORBIDDEN, SubStatus.SUB_GONE)),
+                or_(TrackedSubreddit.config_next_check.is_(None), TrackedSubreddit.config_next_check <= tick))\
+        .order_by(TrackedSubreddit.config_next_check).limit(CONFIG_REFRESH_BATCH_SIZE).all()
+    counts = Counter()
+    for tr in trs:
+        if not config_check_due(tr):  # only needed its first schedule
+            counts["scheduled"] += 1
+            continue
+        worked, status, fetched = refresh_sub_config(wd, tr)
+        counts["fetched" if fetched else "unchanged"] += 1
+        if not worked and tr.subreddit_name in wd.sub_dict:
+            log.info(f"config refresh: dropping {tr.subreddit_name}, {status}")
+            del wd.sub_dict[tr.subreddit_name]
+            wd.nsfw_monitoring_subs.pop(tr.subreddit_name, None)
+        wd.s.commit()
+    wd.s.commit()
+    if trs:
+        log.info(f"config refresh: {counts['unchanged']} unchanged, {counts['fetched']} fetched, "
+                 f"{counts['scheduled']} newly scheduled in {datetime.now() - tick}")
+
+
 def purge_old_records(wd: WorkingData):  # requires db only
+    purge_action_log(wd)
+    if REDDITPOST_PARTITIONING:
+        purge_partitions(wd, REDDITPOST_PARTITIONING)
+        return
+    if PURGE_MODE == "chunked":
+        wd.purge_job.run_tick(wd)
+        return
     purge_statement = "delete t  from RedditPost t inner join TrackedSubs s on t.subreddit_name = s.subreddit_name where  t.time_utc  < utc_timestamp() - INTERVAL greatest(s.min_post_interval_mins, 60*24*10) MINUTE  and t.flagged_duplicate=0 and t.pre_duplicate=0"
     _ = wd.s.execute(purge_statement)
 
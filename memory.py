@@ -0,0 +1,51 @@
+import os
+import resource
+
+from logger import logger
+from static import SESSION_MAX_OBJECTS
+
+
+def current_rss_mb() -> float:
+    # current resident set from /proc, falls back to the peak where /proc isn't available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def release_api_handles(session):
+    # praw objects hung on models are big and refetchable (get_submission_api_handle goes through the status
+    # cache), so drop them once the task they were fetched for is over - lanes keep some models between tasks
+    for obj in list(session.identity_map.values()):
+        if getattr(obj, "api_handle", None) is not None:
+            obj.api_handle = None
+
+
+def end_of_task(session, task_name: str):
+    # once per task, before the session ends. Nothing is trimmed mid-task: the identity map only holds clean
+    # objects weakly, so what a task no longer references is collected anyway, and what it still references
+    # has to stay attached for its changes to be flushed
+    if len(session.identity_map) > SESSION_MAX_OBJECTS:
+        logger.warning(f"{task_name} ended holding {len(session.identity_map)} objects in its session")
+    release_api_handles(session)
+
+
+class MemoryReport:
+    """Session size and RSS around one unit of work, for the per-task log line."""
+
+    def __init__(self, session):
+        self.session = session
+        self.start_rss = current_rss_mb()
+        self.session_objects = 0
+        self.end_rss = self.start_rss
+
+    def finish(self):
+        # call before the session is ended, otherwise the identity map is already empty
+        self.session_objects = len(self.session.identity_map)
+        self.end_rss = current_rss_mb()
+        return self
+
+    def __str__(self):
+        return f"session objects: {self.session_objects}, rss: {self.end_rss:.0f}MB " \
+               f"({self.end_rss - self.start_rss:+.1f}MB)"
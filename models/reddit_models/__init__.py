@@ -3,12 +3,16 @@ from models.reddit_models.actionedcomments import (  # noqa: F401
 )
 from models.reddit_models.broadcast import Broadcast  # noqa: F401
 from models.reddit_models.commonpost import CommonPost  # noqa: F401
+from models.reddit_models.exemptionmatcher import ExemptionMatcher  # noqa: F401
 from models.reddit_models.loggedactions import LoggedAction  # noqa: F401
 from models.reddit_models.postinggroup import PostingGroup  # noqa: F401
 from models.reddit_models.stats2 import Stats2  # noqa: F401
 from models.reddit_models.stats3 import Stats3  # noqa: F401
 from models.reddit_models.subauthor import SubAuthor  # noqa: F401
+from models.reddit_models.submissionrecord import SubmissionRecord  # noqa: F401
 from models.reddit_models.submittedpost import SubmittedPost  # noqa: F401
+from models.reddit_models.task import Task  # noqa: F401
 from models.reddit_models.trackedauthor import TrackedAuthor  # noqa: F401
 from models.reddit_models.trackedsubreddit import TrackedSubreddit
-from models.reddit_models.redditinterface import RedditInterface  # noqa: F401
\ No newline at end of file
+from models.reddit_models.redditinterface import RedditInterface  # noqa: F401
+from models.reddit_models.asyncredditinterface import AsyncRedditInterface  # noqa: F401
\ No newline at end of file
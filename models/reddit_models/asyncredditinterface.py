@@ -0,0 +1,208 @@
+import asyncio
+import inspect
+from typing import List
+
+from logger import logger
+from enums import SubStatus, PostedStatus
+from models.reddit_models import SubmittedPost
+from models.reddit_models.redditinterface import CachedPostStatus, PostedStatusCache, SubredditInfo
+from static import POSTED_STATUS_CACHE_SIZE, POSTED_STATUS_CACHE_TTL_SECS
+from settings import MAIN_BOT_NAME
+from yamlconfig import YAML_ERRORS, load_yaml
+
+try:
+    import asyncpraw
+    import asyncprawcore
+except ImportError:  # optional - only needed for REDDIT_BACKEND = "async"
+    asyncpraw = None
+    asyncprawcore = None
+
+
+class AsyncRedditInterface:
+    """Same calls as RedditInterface, but as coroutines on asyncpraw so independent calls can run at once.
+
+    The bot loop is synchronous, so this owns its own event loop: use run() for one call and gather() to fan out
+    many, e.g. wd.ari.gather(*(wd.ari.get_posted_status(p) for p in posts))
+    """
+    reddit_client = None
+    bot_name = None
+    bot_sub = None
+
+    def __init__(self, status_cache: PostedStatusCache = None):
+        if asyncpraw is None:
+            raise ImportError("asyncpraw is required for the async reddit backend")
+        # pass RedditInterface's so both backends share lookups and invalidations
+        self.status_cache = status_cache or PostedStatusCache(ttl_secs=POSTED_STATUS_CACHE_TTL_SECS,
+                                                              max_size=POSTED_STATUS_CACHE_SIZE)
+        self.loop = asyncio.new_event_loop()
+        self.reddit_client = self.run(self._make_client())
+        self.bot_name = self.run(self.reddit_client.user.me()).name
+
+    async def _make_client(self):
+        return asyncpraw.Reddit()  # same praw.ini site as the sync client
+
+    def run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def gather(self, *coros):
+        # exceptions are returned in place so one bad post doesn't sink the batch
+        async def gather_all():  # gather() binds to the running loop, so it has to be called inside self.loop
+            return await asyncio.gather(*coros, return_exceptions=True)
+        return self.run(gather_all())
+
+    def close(self):
+        self.run(self.reddit_client.close())
+        self.loop.close()
+
+    '''SUBMISSION STUFF'''
+    async def get_posted_status(self, submission: SubmittedPost, get_removed_info=False,
+                                refresh=False) -> PostedStatus:
+        cached = None if refresh else self.status_cache.get(submission.id)
+        api_handle = None
+        try:
+            if not cached:
+                api_handle = await self.reddit_client.submission(id=submission.id)
+                cached = CachedPostStatus(api_handle, self.bot_name)
+                cached.api_handle = None  # an asyncpraw object, of no use to the sync client sharing the cache
+                self.status_cache.put(submission.id, cached)
+            submission.self_deleted = cached.self_deleted
+            submission.banned_by = cached.banned_by
+            submission.post_flair = cached.post_flair
+            submission.author_flair = cached.author_flair
+            if submission.banned_by and submission.banned_by is not True \
+                    and not submission.bot_comment_id and get_removed_info:
+                if not api_handle:
+                    api_handle = await self.reddit_client.submission(id=submission.id)
+                comments = api_handle.comments.list()
+                if inspect.isawaitable(comments):  # a coroutine in older asyncpraw
+                    comments = await comments
+                for c in comments:
+                    if hasattr(c, 'author') and c.author and c.author.name == submission.banned_by:
+                        submission.bot_comment_id = c.id
+                        break
+        except (asyncprawcore.exceptions.Forbidden, asyncprawcore.exceptions.NotFound):
+            return PostedStatus.UNKNOWN
+        return cached.posted_status
+
+    async def mod_remove(self, submission: SubmittedPost) -> bool:
+        api_handle = await self.reddit_client.submission(id=submission.id, fetch=False)
+        try:
+            await api_handle.mod.remove()
+            self.status_cache.invalidate(submission.id)
+            return True
+        except asyncpraw.exceptions.APIException:
+            logger.warning(f'something went wrong removing post: http://redd.it/{submission.id}')
+            return False
+        except (asyncprawcore.exceptions.Forbidden, asyncprawcore.exceptions.ServerError):
+            logger.warning(f'I was not allowed to remove the post: http://redd.it/{submission.id}')
+            return False
+
+    async def reply(self, submission, response, distinguish=True, approve=False, lock_thread=True):
+        api_handle = await self.reddit_client.submission(id=submission.id, fetch=False)
+        try:
+            # first try to lock thread - useless to make a comment unless it's possible
+            if lock_thread:
+                await api_handle.mod.lock()
+            comment = await api_handle.reply(body=response)
+            if comment and distinguish:
+                await comment.mod.distinguish()
+            if comment and approve:
+                await comment.mod.approve()
+            return comment
+        except asyncpraw.exceptions.APIException:
+            logger.warning(f'Something went wrong with replying to this post: http://redd.it/{submission.id}')
+            return False
+        except (asyncprawcore.exceptions.Forbidden, asyncprawcore.exceptions.ServerError,
+                asyncprawcore.exceptions.BadRequest):
+            logger.warning(f'Something with replying to this post:: http://redd.it/{submission.id}')
+            return False
+
+    """SUBREDDIT STUFF"""
+    async def get_mod_list(self, subreddit_name=None, subreddit=None) -> List[str]:
+        if subreddit and not subreddit_name:
+            subreddit_name = subreddit.subreddit_name
+        try:
+            subreddit_api_handle = await self.reddit_client.subreddit(subreddit_name)
+            return [moderator.name for moderator in await subreddit_api_handle.moderator()]
+        except (asyncprawcore.exceptions.NotFound, asyncprawcore.exceptions.Forbidden):
+            return None
+
+    async def get_subreddit_info(self, subreddit_name=None) -> SubredditInfo:
+        si = SubredditInfo(ri=self, subreddit_name=subreddit_name, fetch=False)
+        try:
+            si.subreddit_api_handle = await self.reddit_client.subreddit(subreddit_name, fetch=True)
+        except (asyncprawcore.exceptions.NotFound, asyncprawcore.exceptions.Redirect):
+            si.active_status_enum = SubStatus.SUB_GONE
+            return si
+        except asyncprawcore.exceptions.Forbidden:
+            si.active_status_enum = SubStatus.SUB_FORBIDDEN
+            return si
+
+        mod_list = await self.get_mod_list(subreddit_name=si.subreddit_name)
+        if not mod_list:
+            si.active_status_enum = SubStatus.SUB_FORBIDDEN
+            return si
+        si.mod_list = ','.join(mod_list)
+        if self.bot_name not in si.mod_list:
+            si.active_status_enum = SubStatus.NO_MOD_PRIV
+            return si
+        si.is_nsfw = si.subreddit_api_handle.over18
+
+        possible_wiki_pages = [self.bot_name.lower(), MAIN_BOT_NAME.lower(),
+                               f"config/{self.bot_name.lower()}", f"config/{MAIN_BOT_NAME.lower()}"]
+        try:
+            for possible_wiki_page in possible_wiki_pages:
+                try:
+                    wiki_page = await si.subreddit_api_handle.wiki.get_page(possible_wiki_page)
+                except asyncprawcore.exceptions.NotFound:
+                    continue
+                si.settings_yaml_txt = wiki_page.content_md
+                si.settings_revision_date = wiki_page.revision_date
+                si.settings_wiki_page = possible_wiki_page
+                if wiki_page.revision_by and wiki_page.revision_by.name != self.bot_name:
+                    si.bot_mod = wiki_page.revision_by.name
+                si.settings_yaml = load_yaml(si.settings_yaml_txt)
+                break
+        except asyncprawcore.exceptions.Forbidden:
+            si.active_status_enum = SubStatus.CONFIG_ACCESS_ERROR
+            return si
+        except YAML_ERRORS:
+            si.active_status_enum = SubStatus.YAML_SYNTAX_ERROR
+            return si
+        si.active_status_enum = SubStatus.YAML_SYNTAX_OK if si.settings_yaml_txt else SubStatus.NO_CONFIG
+        return si
+
+    async def send_modmail(self, subreddit=None, subreddit_name=None, subject=None, body="Unspecified text",
+                           thread_id=None, use_same_thread=False):
+        conversation = None
+        if subject is None:
+            subject = f"[Notification] Message from {self.bot_name}"
+        if subreddit_name in (self.bot_name, MAIN_BOT_NAME):
+            subreddit = self.bot_sub
+        if subreddit and not thread_id and use_same_thread:
+            thread_id = subreddit.mm_convo_id
+        if not subreddit_name and subreddit:
+            subreddit_name = subreddit.subreddit_name
+
+        subreddit_api_handle = await self.reddit_client.subreddit(subreddit_name)
+        already_done = False
+        if thread_id:
+            try:
+                thread = await subreddit_api_handle.modmail(thread_id)
+                conversation = await thread.reply(body=body, internal=True)
+                already_done = True
+            except asyncpraw.exceptions.RedditAPIException:
+                subreddit.mm_convo_id = None
+            except (asyncpraw.exceptions.APIException, asyncprawcore.exceptions.Forbidden, AttributeError) as e:
+                logger.warning(f'something went wrong in sending modmail {e}')
+                already_done = True
+
+        if not already_done:
+            try:
+                conversation = await subreddit_api_handle.message(subject=subject, message=body)
+                if subreddit and conversation:
+                    subreddit.mm_convo_id = conversation.id
+            except (asyncpraw.exceptions.APIException, asyncprawcore.exceptions.Forbidden, AttributeError) as e:
+                logger.warning(f'something went wrong in sending modmail {e}')
+
+        return conversation
@@ -0,0 +1,81 @@
+import re
+from typing import Iterable, Optional, Tuple
+
+try:
+    import ahocorasick
+except ImportError:  # optional - the combined regex is used without it
+    ahocorasick = None
+
+
+def keyword_tuple(setting) -> Tuple[str, ...]:
+    # settings arrive as a str, a list, or a list already "|".join()ed by reload_yaml_settings
+    if not setting:
+        return ()
+    items = setting if isinstance(setting, (list, tuple)) else str(setting).split("|")
+    return tuple(sorted({str(item).lower() for item in items if str(item)}))
+
+
+class KeywordSet:
+    """Any-substring test against a fixed set of lower-cased keywords, one pass over the text."""
+
+    def __init__(self, keywords: Tuple[str, ...]):
+        self.keywords = keywords
+        self.automaton = None
+        self.regex = None
+        if not keywords:
+            return
+        if ahocorasick:
+            self.automaton = ahocorasick.Automaton()
+            for keyword in keywords:
+                self.automaton.add_word(keyword, keyword)
+            self.automaton.make_automaton()
+        else:
+            # longest first so the alternation doesn't stop at a shorter prefix
+            self.regex = re.compile("|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)))
+
+    def __bool__(self):
+        return bool(self.keywords)
+
+    def first_match(self, text: Optional[str]) -> Optional[str]:
+        if not text or not self.keywords:
+            return None
+        text = text.lower()
+        if self.automaton:
+            for _, keyword in self.automaton.iter(text):
+                return keyword
+            return None
+        match = self.regex.search(text)
+        return match.group(0) if match else None
+
+
+class ExemptionMatcher:
+    """A sub's exemption rules compiled once per config load, see TrackedSubreddit.get_exemption_matcher()"""
+
+    def __init__(self, title_exempt_keyword=None, title_not_exempt_keyword=None, author_exempt_flair_keyword=None,
+                 author_not_exempt_flair_keyword=None, mods: Iterable[str] = ()):
+        self.title_exempt = KeywordSet(keyword_tuple(title_exempt_keyword))
+        self.title_not_exempt = KeywordSet(keyword_tuple(title_not_exempt_keyword))
+        self.author_exempt_flair = KeywordSet(keyword_tuple(author_exempt_flair_keyword))
+        self.author_not_exempt_flair = KeywordSet(keyword_tuple(author_not_exempt_flair_keyword))
+        self.mods = frozenset(mod.lower() for mod in mods if mod)
+
+    @classmethod
+    def from_sub(cls, tr_sub):
+        return cls(tr_sub.title_exempt_keyword, tr_sub.title_not_exempt_keyword, tr_sub.author_exempt_flair_keyword,
+                   tr_sub.author_not_exempt_flair_keyword,
+                   mods=tr_sub.mod_list.split(",") if tr_sub.mod_list else ())
+
+    @property
+    def needs_author_flair(self) -> bool:
+        return bool(self.author_exempt_flair or self.author_not_exempt_flair)
+
+    @property
+    def needs_link_flair(self) -> bool:
+        return bool(self.title_not_exempt)
+
+    def is_mod(self, author_name: str) -> bool:
+        return bool(author_name) and author_name.lower() in self.mods
+
+    def title_restriction_met(self, title: str, link_flair: Optional[str]) -> bool:
+        # title_not_exempt_keyword: only posts mentioning one of these (in title or flair) are counted
+        return bool(self.title_not_exempt.first_match(title) or self.title_not_exempt.first_match(link_flair))
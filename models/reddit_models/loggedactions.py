@@ -1,12 +1,19 @@
 from datetime import datetime
 
 from core import dbobj
-from sqlalchemy import Column, DateTime, String, Boolean, UnicodeText, Integer
+from enums import ActionStatus
+from sqlalchemy import Column, DateTime, Enum, Index, String, Boolean, UnicodeText, Integer
 
 
 class LoggedAction(dbobj.Base):
+    """One outward reddit action. (action_type, action_id) is the idempotency key - see actionqueue.py"""
 
     __tablename__ = 'LoggedActions'
+    # create_all won't add these to an existing table - run index_migration.py
+    __table_args__ = (
+        Index('ix_LoggedActions_status_next_attempt', 'action_status_enum', 'next_attempt'),  # the drain
+        Index('ix_LoggedActions_status_date', 'action_status_enum', 'date_actioned'),  # purge_action_log
+    )
     subreddit_name = Column(String(191), nullable=True)
     action_type = Column(String(191), nullable=False, primary_key=True)
     action_id = Column(String(191), nullable=True, primary_key=True)
@@ -14,6 +21,10 @@ class LoggedAction(dbobj.Base):
     action_try_count = Column(Integer, nullable=False)
     action_completed = Column(Boolean, nullable=True)
     error_report = Column(UnicodeText, nullable=True)
+    action_status_enum = Column(Enum(ActionStatus), nullable=True)
+    payload = Column(UnicodeText, nullable=True)  # json arguments for the action
+    next_attempt = Column(DateTime, nullable=True)
+    last_attempt = Column(DateTime, nullable=True)
 
     def __init__(self, subreddit_name, action_type, action_id):
         self.action_type = action_type
@@ -3,7 +3,6 @@ from praw import exceptions
 from praw.models import Submission
 
 import praw
-import yaml
 import prawcore
 from logger import logger
 from enums import SubStatus, PostedStatus, CountedStatus
@@ -12,27 +11,54 @@ from enums import SubStatus, PostedStatus, CountedStatus
 from models.reddit_models import SubmittedPost, TrackedSubreddit, TrackedAuthor
 
 from settings import MAIN_BOT_NAME
-from typing import List
-from datetime import datetime
-from static import DEFAULT_CONFIG
+from typing import Dict, List
+from collections import OrderedDict
+import threading
+from datetime import datetime, timedelta
+from static import DEFAULT_CONFIG, POSTED_STATUS_CACHE_TTL_SECS, POSTED_STATUS_CACHE_SIZE
+from ratelimit import RateLimitGovernor
+from yamlconfig import YAML_ERRORS, load_yaml
 import pytz
 # Set up PRAW
 
 
 class RedditInterface:
     bot_sub = None
-    reddit_client = None
     bot_name = None
 
     def __init__(self):
-        self.reddit_client = praw.Reddit(
-                                    )
+        # praw isn't thread-safe, so every thread gets its own praw.Reddit (see reddit_client); they all wait on
+        # the one rate limit governor, by the calling task's priority, and share the status cache
+        self.local = threading.local()
+        self.rate_limiter = RateLimitGovernor()
+        self.status_cache = PostedStatusCache(ttl_secs=POSTED_STATUS_CACHE_TTL_SECS,
+                                              max_size=POSTED_STATUS_CACHE_SIZE)
         self.bot_name = self.reddit_client.user.me().name
 
+    @property
+    def reddit_client(self) -> praw.Reddit:
+        client = getattr(self.local, "reddit_client", None)
+        if not client:
+            client = praw.Reddit()
+            self.rate_limiter.install(client)
+            self.local.reddit_client = client
+        return client
+
+    def init_worker(self, priority: str):
+        # ThreadPoolExecutor initializer: the submitting task's rate limit priority, and a client of its own
+        self.rate_limiter.set_priority(priority)
+        _ = self.reddit_client
+
+    def owns(self, api_handle) -> bool:
+        # praw objects make their requests through the client that created them - only use this thread's
+        return getattr(api_handle, "_reddit", None) is self.reddit_client
+
     '''SUBMISSION STUFF'''
     def get_submission_api_handle(self, submission: SubmittedPost) -> praw.models.Submission:
-        if not submission.api_handle:
-            submission.api_handle = self.reddit_client.submission(id=submission.id)
+        if not submission.api_handle or not self.owns(submission.api_handle):
+            cached = self.status_cache.get(submission.id)
+            submission.api_handle = cached.api_handle if cached and self.owns(cached.api_handle) \
+                else self.reddit_client.submission(id=submission.id)
             return submission.api_handle
         else:
             return submission.api_handle
@@ -69,46 +95,51 @@ class RedditInterface:
 
 
 
-    def get_posted_status(self, submission: SubmittedPost, get_removed_info=False) -> PostedStatus:
-        print(f'getting posted status...  current status:{submission.posted_status}')
-        # _ = submission.get_api_handle()  what was this for again?
-        post_api_handle = self.get_submission_api_handle(submission)  # updates the api handle
-        try:
-            submission.self_deleted = False if submission.api_handle.author else True
-        except prawcore.exceptions.Forbidden:
-            return PostedStatus.UNKNOWN
-        submission.banned_by = submission.api_handle.banned_by
-        if not submission.banned_by and not submission.self_deleted:
-            return PostedStatus.UP
-        elif submission.banned_by:
-            if submission.banned_by is True:
-                return PostedStatus.SPAM_FLT
-            if not submission.bot_comment_id and get_removed_info:  # make sure to commit to db
-                top_level_comments = list(submission.api_handle.comments)
+    def get_posted_statuses(self, submissions: List[SubmittedPost], get_removed_info=False,
+                            refresh=False) -> Dict[str, PostedStatus]:
+        # One /api/info request per 100 posts instead of one lazy fetch per post.
+        # Anything fetched within the cache ttl is reused unless refresh is set.
+        to_fetch = list(dict.fromkeys(submission.id for submission in submissions
+                                      if refresh or not self.status_cache.get(submission.id)))
+        if to_fetch:
+            print(f'getting posted status for {len(to_fetch)} post(s)...')
+            for api_handle in self.reddit_client.info(fullnames=[f"t3_{post_id}" for post_id in to_fetch]):
+                self.status_cache.put(api_handle.id, CachedPostStatus(api_handle, self.bot_name))
+
+        statuses = {}
+        for submission in submissions:
+            cached = self.status_cache.get(submission.id)
+            if not cached:  # not returned by reddit - no access
+                statuses[submission.id] = PostedStatus.UNKNOWN
+                continue
+            if self.owns(cached.api_handle):  # None when cached by the async backend, or another thread's
+                submission.api_handle = cached.api_handle
+            submission.self_deleted = cached.self_deleted
+            submission.banned_by = cached.banned_by
+            submission.post_flair = cached.post_flair
+            submission.author_flair = cached.author_flair
+            if submission.banned_by and submission.banned_by is not True \
+                    and not submission.bot_comment_id and get_removed_info:  # make sure to commit to db
+                top_level_comments = list(self.get_submission_api_handle(submission).comments)
                 for c in top_level_comments:
                     if hasattr(c, 'author') and c.author and c.author.name == submission.banned_by:
                         submission.bot_comment_id = c.id
                         break
-            if submission.banned_by == "AutoModerator":
-                return PostedStatus.AUTOMOD_RM
-            elif submission.banned_by == "Flair_Helper":
-                return PostedStatus.FH_RM
-            elif submission.banned_by in (self.bot_name, MAIN_BOT_NAME):
-                return PostedStatus.MHB_RM
-            elif "bot" in submission.banned_by.lower():
-                return PostedStatus.BOT_RM
-            else:
-                return PostedStatus.MOD_RM
-        elif submission.self_deleted:
-            return PostedStatus.SELF_DEL
-        else:
-            print(f"unknown status: {submission.banned_by}")
-            return PostedStatus.UNKNOWN
+            statuses[submission.id] = cached.posted_status
+        return statuses
+
+    def invalidate_posted_status(self, submission_id: str):
+        # call after we change a post ourselves (remove/approve) so the next lookup goes back to reddit
+        self.status_cache.invalidate(submission_id)
+
+    def get_posted_status(self, submission: SubmittedPost, get_removed_info=False) -> PostedStatus:
+        return self.get_posted_statuses([submission], get_removed_info=get_removed_info)[submission.id]
 
     def mod_remove(self, submission: SubmittedPost) -> bool:
         _ = self.get_submission_api_handle(submission)  # updates the api handle
         try:
             submission.api_handle.mod.remove()
+            self.invalidate_posted_status(submission.id)
             return True
         except praw.exceptions.APIException:
             logger.warning(f'something went wrong removing post: http://redd.it/{submission.id}')
@@ -153,7 +184,7 @@ class RedditInterface:
 
     def get_subreddit_api_handle(self, subreddit: TrackedSubreddit) -> praw.models.Subreddit:
         assert(isinstance(subreddit,TrackedSubreddit))
-        if not subreddit.api_handle:
+        if not subreddit.api_handle or not self.owns(subreddit.api_handle):
             subreddit.api_handle = self.reddit_client.subreddit(subreddit.subreddit_name)
             return subreddit.api_handle
         else:
@@ -164,6 +195,15 @@ class RedditInterface:
         return si
 
 
+    def get_wiki_revision_date(self, subreddit_name, wiki_page_name):
+        # one small revisions listing - no mod list, page probes or page content
+        try:
+            for revision in self.reddit_client.subreddit(subreddit_name).wiki[wiki_page_name].revisions(limit=1):
+                return revision["timestamp"]
+        except (prawcore.exceptions.NotFound, prawcore.exceptions.Forbidden, prawcore.exceptions.Redirect):
+            pass
+        return None
+
     def get_modmail_thread_id(self, subreddit_name=None):
         for convo in self.reddit_client.subreddit(subreddit_name).modmail.conversations(state="mod", sort='unread', limit=30):
 
@@ -238,33 +278,70 @@ class RedditInterface:
 
 
 
-class SubmissionInfo:
-    def __init__(self, submission):
-        subm_api_handle = None
-        # static
-        self.id = submission.id
-        self.title = submission.title[0:190]
-        self.submission_text = submission.selftext[0:190]
-        self.time_utc = datetime.utcfromtimestamp(submission.created_utc)
-        self.subreddit_name = str(submission.subreddit).lower()
-        self.is_self = submission.is_self
-        # self.is_nsfw = submission.over18
-        self.is_oc = submission.is_original_content
-
-        # may change
-        self.author = str(submission.author)  # don't change once deleted
-        self.banned_by = submission.banned_by
-        self.post_flair = submission.link_flair_text
-        self.author_flair = submission.author_flair_text
-        # self.author_css = submission.author_flair_css_class
-
+class CachedPostStatus:
+    def __init__(self, api_handle, bot_name):
+        self.cached_at = datetime.now()
+        self.api_handle = api_handle
+        self.self_deleted = False if api_handle.author else True
+        self.banned_by = api_handle.banned_by
+        self.post_flair = api_handle.link_flair_text
+        self.author_flair = api_handle.author_flair_text
+        self.posted_status = classify_posted_status(self.banned_by, self.self_deleted, bot_name)
+
+
+class PostedStatusCache:
+    """LRU of CachedPostStatus by post id, entries expire after ttl_secs. Shared by the task lanes, so locked"""
+    def __init__(self, ttl_secs=300, max_size=20000):
+        self.ttl = timedelta(seconds=ttl_secs)
+        self.max_size = max_size
+        self.entries: OrderedDict[str, CachedPostStatus] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, post_id: str):
+        with self.lock:
+            cached = self.entries.get(post_id)
+            if not cached:
+                return None
+            if cached.cached_at < datetime.now() - self.ttl:
+                del self.entries[post_id]
+                return None
+            self.entries.move_to_end(post_id)
+            return cached
+
+    def put(self, post_id: str, cached: CachedPostStatus):
+        with self.lock:
+            self.entries[post_id] = cached
+            self.entries.move_to_end(post_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, post_id: str):
+        with self.lock:
+            self.entries.pop(post_id, None)
+
+
+def classify_posted_status(banned_by, self_deleted, bot_name) -> PostedStatus:
+    if not banned_by and not self_deleted:
+        return PostedStatus.UP
+    elif banned_by:
+        if banned_by is True:
+            return PostedStatus.SPAM_FLT
+        if banned_by == "AutoModerator":
+            return PostedStatus.AUTOMOD_RM
+        elif banned_by == "Flair_Helper":
+            return PostedStatus.FH_RM
+        elif banned_by in (bot_name, MAIN_BOT_NAME):
+            return PostedStatus.MHB_RM
+        elif "bot" in banned_by.lower():
+            return PostedStatus.BOT_RM
+        else:
+            return PostedStatus.MOD_RM
+    elif self_deleted:
+        return PostedStatus.SELF_DEL
+    else:
+        print(f"unknown status: {banned_by}")
+        return PostedStatus.UNKNOWN
 
-    def update(self, submission):
-        # self.author = str(submission.author)
-        self.banned_by = submission.banned_by
-        self.post_flair = submission.link_flair_text
-        self.author_flair = submission.author_flair_text
-        # self.author_css = submission.author_flair_css_class
 
 class SubredditInfo:
     subreddit_api_handle = None
@@ -273,12 +350,15 @@ class SubredditInfo:
     mod_list = None
     settings_yaml_txt = None
     settings_revision_date = None
+    settings_wiki_page = None
     settings_yaml = None
     bot_mod = None
     is_nsfw = False
 
-    def __init__(self, ri, subreddit_name):
+    def __init__(self, ri, subreddit_name, fetch=True):
         self.subreddit_name: str = subreddit_name.lower()
+        if not fetch:  # caller fills in the rest (async backend)
+            return
         self.subreddit_api_handle = ri.reddit_client.subreddit(subreddit_name)
 
         if not self.subreddit_api_handle:  # Subreddit doesn't exist
@@ -317,9 +397,10 @@ class SubredditInfo:
                     self.settings_yaml_txt = wiki_page.content_md
                     print(self.settings_yaml_txt[0:20])
                     self.settings_revision_date = wiki_page.revision_date
+                    self.settings_wiki_page = possible_wiki_page
                     if wiki_page.revision_by and wiki_page.revision_by.name != ri.bot_name:
                         self.bot_mod = wiki_page.revision_by.name
-                    self.settings_yaml = yaml.safe_load(self.settings_yaml_txt)
+                    self.settings_yaml = load_yaml(self.settings_yaml_txt)
                     break
                 except prawcore.exceptions.NotFound:
                     pass
@@ -334,7 +415,7 @@ class SubredditInfo:
                 self.settings_revision_date = wiki_page.revision_date
                 if wiki_page.revision_by and wiki_page.revision_by.name != ri.bot_name:
                     self.bot_mod = wiki_page.revision_by.name
-                self.settings_yaml = yaml.safe_load(self.settings_yaml_txt)
+                self.settings_yaml = load_yaml(self.settings_yaml_txt)
             if not self.settings_yaml_txt:
                 return SubStatus.NO_CONFIG, f"I did not find a config for /r/{self.subreddit_name} " \
                                             f"Please create one at " \
@@ -347,7 +428,7 @@ class SubredditInfo:
             return SubStatus.CONFIG_ACCESS_ERROR, f"I do not have any access to /r/{self.subreddit_name}."
         except prawcore.exceptions.Redirect:
             return SubStatus.SUB_GONE, f"Reddit reports that there is no subreddit by the name of {self.subreddit_name}."
-        except (yaml.scanner.ScannerError, yaml.composer.ComposerError, yaml.parser.ParserError):
+        except YAML_ERRORS:
             return SubStatus.YAML_SYNTAX_ERROR, f"There is a syntax error in your config: " \
                                                 f"http://www.reddit.com/r/{self.subreddit_name}/wiki/{ri.bot_name} ." \
                                                 f"Please validate your config using http://www.yamllint.com/. "
@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytz
+from enums import CountedStatus, PostedStatus
+
+
+class SubmissionRecord:
+    """What ingestion and the frequency checks need from a praw Submission, without the ORM or the api handle.
+
+    Only persistence turns these into rows (to_row) or SubmittedPost objects.
+    """
+    __slots__ = ("id", "title", "author", "submission_text", "time_utc", "subreddit_name", "is_self", "is_oc",
+                 "banned_by", "post_flair", "author_flair", "counted_status_enum", "posted_status", "reviewed")
+
+    def __init__(self, id, title, author, time_utc, subreddit_name, submission_text=None, is_self=False,
+                 is_oc=False, banned_by=None, post_flair=None, author_flair=None):
+        self.id = id
+        self.title = title
+        self.author = author
+        self.submission_text = submission_text
+        self.time_utc = time_utc
+        self.subreddit_name = subreddit_name
+        self.is_self = is_self
+        self.is_oc = is_oc
+        self.banned_by = banned_by
+        self.post_flair = post_flair
+        self.author_flair = author_flair
+        self.counted_status_enum = CountedStatus.NOT_CHKD
+        self.posted_status = PostedStatus.UNKNOWN.value
+        self.reviewed = False
+
+    @classmethod
+    def from_submission(cls, submission, save_text: bool = False):
+        # banned_by is left None, as before: the listing value isn't trusted until a status check
+        return cls(submission.id, submission.title[0:190], str(submission.author),
+                   datetime.utcfromtimestamp(submission.created_utc), str(submission.subreddit).lower(),
+                   submission_text=submission.selftext[0:190] if save_text else None,
+                   is_self=submission.is_self, is_oc=submission.is_original_content,
+                   post_flair=submission.link_flair_text, author_flair=submission.author_flair_text)
+
+    def to_row(self) -> dict:
+        # every column a new RedditPost row needs
+        now = datetime.now(pytz.utc)
+        return dict(
+            id=self.id,
+            title=self.title,
+            author=self.author,
+            submission_text=self.submission_text,
+            time_utc=self.time_utc,
+            subreddit_name=self.subreddit_name,
+            added_time=now,
+            last_reviewed=now,
+            last_checked=now,
+            flushed_to_log=False,
+            flagged_duplicate=False,
+            reviewed=self.reviewed,
+            banned_by=self.banned_by,
+            pre_duplicate=False,
+            is_self=self.is_self,
+            counted_status=self.counted_status_enum.value,
+            counted_status_enum=self.counted_status_enum,
+            post_flair=self.post_flair,
+            author_flair=self.author_flair,
+            response_time=None,
+            nsfw_last_checked=self.time_utc,
+            nsfw_repliers_checked=False,
+            posted_status=self.posted_status,
+            is_oc=self.is_oc,
+        )
@@ -6,10 +6,11 @@ import pytz
 from core import dbobj
 from logger import logger
 from praw.models import Submission
-from sqlalchemy import Boolean, Column, DateTime, Integer, String, UnicodeText
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, String, UnicodeText
 from enums import CountedStatus, PostedStatus
 from sqlalchemy import Enum
-# from models.reddit_models.redditinterface import SubmissionInfo
+from sqlalchemy.orm import validates
+from models.reddit_models.submissionrecord import SubmissionRecord
 
 s = dbobj.s
 
@@ -17,6 +18,15 @@ s = dbobj.s
 
 class SubmittedPost(dbobj.Base):  # need posted_status
     __tablename__ = 'RedditPost'
+    # create_all won't add these to an existing table - run index_migration.py
+    __table_args__ = (
+        Index('ix_RedditPost_sub_author_time', 'subreddit_name', 'author', 'time_utc'),  # back posts, frequency
+        Index('ix_RedditPost_status_time', 'counted_status_enum', 'time_utc'),  # status updates, removals, nsfw
+        Index('ix_RedditPost_reviewed_status_time', 'reviewed', 'counted_status_enum', 'time_utc'),  # leftovers
+        Index('ix_RedditPost_added_time', 'added_time'),
+        Index('ix_RedditPost_time_utc', 'time_utc'),  # purge and stats ranges
+        Index('ix_RedditPost_review_debug', 'review_debug', mysql_length=3),  # prefix is enough for LIKE 'ma:%'
+    )
     id = Column(String(10), nullable=True, primary_key=True)
     title = Column(String(191), nullable=True)
     author = Column(String(21), nullable=True)
@@ -58,68 +68,24 @@ class SubmittedPost(dbobj.Base):  # need posted_status
     api_handle = None
 
     def __init__(self, submission, save_text: bool = False):
-        self.nsfw_last_checked = datetime.now(pytz.utc)
-        self.last_checked = datetime.now(pytz.utc)
-        self.flushed_to_log = False
+        # from a praw Submission, or a SubmissionRecord that ingestion already built
         if isinstance(submission, Submission):
-
-            self.id = submission.id
-            self.title = submission.title[0:190]
-            self.author = str(submission.author)
-            if save_text:
-                self.submission_text = submission.selftext[0:190]
-            self.time_utc = datetime.utcfromtimestamp(submission.created_utc)
-            self.subreddit_name = str(submission.subreddit).lower()
-            self.added_time = datetime.now(pytz.utc)
-            self.last_reviewed = datetime.now(pytz.utc)
-            self.flagged_duplicate = False
-            self.reviewed = False
-            self.banned_by = None
+            record = SubmissionRecord.from_submission(submission, save_text=save_text)
             self.api_handle = submission
-            self.pre_duplicate = False
-            self.self_deleted = False
-            self.is_self = submission.is_self
-            self.counted_status = CountedStatus.NOT_CHKD.value
-            self.counted_status_enum = CountedStatus.NOT_CHKD
-            self.post_flair = submission.link_flair_text
-            self.author_flair = submission.author_flair_text
-            # self.author_css = submission.author_flair_css_class
-            self.response_time = None
-            self.nsfw_last_checked = self.time_utc
-            self.nsfw_repliers_checked = False
-            self.posted_status = PostedStatus.UNKNOWN.value
-            self.is_oc = submission.is_original_content
         else:
-            subm_info = submission
-
-            self.id = subm_info.id
-            self.title = subm_info.title
-            self.submission_text = None
-            self.subreddit_name = subm_info.subreddit_name
-            self.added_time = datetime.now(pytz.utc)
-            self.last_reviewed = datetime.now(pytz.utc)
-            self.flagged_duplicate = False
-            self.reviewed = False
-            self.banned_by = subm_info.banned_by
-            self.api_handle = None
-            self.pre_duplicate = False
-            self.self_deleted = False
-            self.is_self = subm_info.is_self
-            self.counted_status = -1  # CountedStatus.NOT_CHKD.value
-            self.counted_status_enum = CountedStatus.NOT_CHKD
-            self.post_flair = subm_info.post_flair
-            self.author_flair = subm_info.author_flair
-            # self.author_css = subm_info.author_css
-            self.response_time = None
-            self.nsfw_last_checked = self.time_utc
-            self.nsfw_repliers_checked = False
-            self.posted_status = PostedStatus.UNKNOWN.value
-            self.is_oc = subm_info.is_oc
-
+            record = submission
+        for key, value in record.to_row().items():
+            setattr(self, key, value)
+        self.self_deleted = False
 
     def get_url(self) -> str:
         return f"http://redd.it/{self.id}"
 
+    @validates('subreddit_name')
+    def normalize_subreddit_name(self, key, subreddit_name):
+        # always stored lowercase so lookups can be exact matches on the index
+        return subreddit_name.lower() if subreddit_name else subreddit_name
+
     def get_comments_url(self) -> str:
         return f"https://www.reddit.com/r/{self.subreddit_name}/comments/{self.id}"
 
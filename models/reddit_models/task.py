@@ -1,15 +1,21 @@
+from core import dbobj
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, Text
 
 
-
-class Task(Base):
+class Task(dbobj.Base):  # persisted scheduler state, one row per scheduled function
     __tablename__ = 'aa_tasks'
 
     task_name = Column(String(191), nullable=False, primary_key=True)
-    run_interval = Column(Integer, nullable=False)
-    last_ran = Column(DateTime, nullable=False)
+    run_interval = Column(Integer, nullable=False)  # seconds
+    last_ran = Column(DateTime, nullable=True)
     last_error = Column(Text, nullable=True)
     last_report = Column(Text, nullable=True)
     force_run = Column(Boolean, nullable=False)
+    next_run = Column(DateTime, nullable=True)  # pushed back while erroring
+    error_count = Column(Integer, nullable=False, default=0)
+    last_duration = Column(Integer, nullable=True)  # seconds
+    checkpoint = Column(String(191), nullable=True)  # where a task working through a table in passes left off
+    next_pass = Column(DateTime, nullable=True)  # and when its next pass starts, once one is finished
 
     def __init__(self, task_name, run_interval):
         self.task_name = task_name
@@ -18,25 +24,10 @@ class Task(Base):
         self.last_error = None
         self.last_report = None
         self.force_run = False
+        self.next_run = None
+        self.error_count = 0
+        self.last_duration = None
+        self.checkpoint = None
+        self.next_pass = None
 
 ## Hall Pass used notification: author, post, subreddit
-
-
-"""
-    task_name = Column(String(191), nullable=False, primary_key=True)
-    run_interval = Column(Integer, nullable=False)
-    last_ran = Column(DateTime, nullable=False)
-    last_error = Column(Text, nullable=True)
-    last_report = Column(Text, nullable=True)
-    force_run = Column(Boolean, nullable=False)
-
-    def __init__(self, task_name, run_interval):
-        self.task_name = task_name
-        self.run_interval = run_interval
-        self.last_ran = None
-        self.last_error = None
-        self.last_report = None
-        self.force_run = False
-
-"""
-
@@ -1,13 +1,13 @@
+import json
 import re
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, List, Tuple
 
 import humanize
 import pytz
-import yaml
 from core import dbobj
 from enums import CountedStatus, SubStatus
-from models.reddit_models import SubmittedPost
+from models.reddit_models import ExemptionMatcher, SubmittedPost
 from logger import logger
 from sqlalchemy import (
     SMALLINT,
@@ -23,6 +23,7 @@ from sqlalchemy import (
 
 from settings import MAIN_BOT_NAME
 from sqlalchemy import Enum
+from yamlconfig import YAML_ERRORS, content_hash, load_yaml, to_settings_json
 
 s = dbobj.s
 
@@ -33,6 +34,8 @@ class TrackedSubreddit(dbobj.Base):
     # checking_mail_enabled = Column(Boolean, nullable=True)  #don't need this?
     settings_yaml_txt = Column(UnicodeText, nullable=True)
     settings_yaml = None
+    settings_yaml_hash = Column(String(40), nullable=True)  # sha1 of the settings_yaml_txt settings_json came from
+    settings_json = Column(UnicodeText, nullable=True)  # settings_yaml_txt already parsed, loads far faster than yaml
     last_updated = Column(DateTime, nullable=True)
     # last_error_msg = Column(DateTime, nullable=True)  # not used
     save_text = Column(Boolean, nullable=True)
@@ -63,6 +66,11 @@ class TrackedSubreddit(dbobj.Base):
 
     last_pulled = Column(DateTime, nullable=True)
     config_last_checked = Column(DateTime, nullable=True)
+    config_next_check = Column(DateTime, nullable=True)  # jittered, see utils.schedule_next_config_check
+    settings_wiki_page = Column(String(191), nullable=True)  # wiki page the config was found on
+    settings_revision_date = Column(Integer, nullable=True)  # that page's last revision, epoch secs
+    newest_post_id = Column(String(10), nullable=True)  # ingestion cursor: newest post already in db
+    newest_post_utc = Column(DateTime, nullable=True)
 
     subreddit_mods = []
     rate_limiting_enabled = False
@@ -101,6 +109,8 @@ class TrackedSubreddit(dbobj.Base):
 
     canned_responses = {}
     api_handle = None
+    exemption_matcher = None  # compiled from the settings below on first use after each config load
+    loaded_config = None  # config_version() the settings below were last loaded from
     nsfw_instaban_subs = None
 
     nsfw_pct_instant_ban = False
@@ -131,7 +141,10 @@ class TrackedSubreddit(dbobj.Base):
         self.mod_list = sub_info.mod_list
         self.settings_yaml_txt = sub_info.settings_yaml_txt
         self.settings_revision_date = sub_info.settings_revision_date
+        self.settings_wiki_page = sub_info.settings_wiki_page
         self.settings_yaml = sub_info.settings_yaml
+        if sub_info.settings_yaml_txt and sub_info.settings_yaml is not None:  # parsed already, don't again
+            self.cache_settings(sub_info.settings_yaml)
         self.bot_mod = sub_info.bot_mod
         self.is_nsfw = sub_info.is_nsfw
         self.last_updated = datetime.now()
@@ -147,7 +160,10 @@ class TrackedSubreddit(dbobj.Base):
         self.mod_list = sub_info.mod_list
         self.settings_yaml_txt = sub_info.settings_yaml_txt
         self.settings_revision_date = sub_info.settings_revision_date
+        self.settings_wiki_page = sub_info.settings_wiki_page
         self.settings_yaml = sub_info.settings_yaml
+        if sub_info.settings_yaml_txt and sub_info.settings_yaml is not None:  # parsed already, don't again
+            self.cache_settings(sub_info.settings_yaml)
         self.bot_mod = sub_info.bot_mod
         self.is_nsfw = sub_info.is_nsfw
         self.last_updated = datetime.now()
@@ -156,7 +172,42 @@ class TrackedSubreddit(dbobj.Base):
 
         return self.reload_yaml_settings()
 
+    def has_passed_cursor(self, post_id: str, created_utc: datetime) -> bool:
+        if not self.newest_post_utc:
+            return False
+        return post_id == self.newest_post_id or created_utc < self.newest_post_utc
+
+    def advance_cursor(self, post_id: str, created_utc: datetime):
+        if not self.newest_post_utc or created_utc > self.newest_post_utc:
+            self.newest_post_id = post_id
+            self.newest_post_utc = created_utc
+
+    def get_exemption_matcher(self) -> ExemptionMatcher:
+        if not self.exemption_matcher:
+            self.exemption_matcher = ExemptionMatcher.from_sub(self)
+        return self.exemption_matcher
+
+    def cache_settings(self, settings_yaml):
+        self.settings_json = to_settings_json(settings_yaml)
+        self.settings_yaml_hash = content_hash(self.settings_yaml_txt) if self.settings_json else None
+
+    def config_version(self) -> Tuple:
+        return self.settings_revision_date, self.settings_yaml_hash or content_hash(self.settings_yaml_txt or "")
+
+    def config_changed(self) -> bool:
+        # another lane (or process) stored a different config since this copy's settings were loaded
+        return self.loaded_config != self.config_version()
+
+    def parse_settings_yaml(self):
+        # settings_json stands in for the yaml as long as the text it was parsed from hasn't changed
+        if self.settings_json and self.settings_yaml_hash == content_hash(self.settings_yaml_txt):
+            return json.loads(self.settings_json)
+        settings_yaml = load_yaml(self.settings_yaml_txt)
+        self.cache_settings(settings_yaml)
+        return settings_yaml
+
     def reload_yaml_settings(self) -> (Boolean, String):
+        self.exemption_matcher = None
         if self.active_status_enum in (SubStatus.SUB_FORBIDDEN, SubStatus.SUB_GONE, SubStatus.CONFIG_ACCESS_ERROR):
             print(f"Sub access issue  {self.active_status_enum}")
             return False, f"Sub access issue  {self.active_status_enum}"
@@ -165,8 +216,9 @@ class TrackedSubreddit(dbobj.Base):
             self.active_status_enum = SubStatus.NO_CONFIG
             return False, "Nothing in yaml?"
         try:
-            self.settings_yaml = yaml.safe_load(self.settings_yaml_txt)
-        except (yaml.scanner.ScannerError, yaml.composer.ComposerError, yaml.parser.ParserError):
+            self.settings_yaml = self.parse_settings_yaml()
+            self.loaded_config = self.config_version()
+        except YAML_ERRORS:
             self.active_status_enum = SubStatus.YAML_SYNTAX_ERROR
             return False, f"There is a syntax error in your config: " \
                           f"http://www.reddit.com/r/{self.subreddit_name}/wiki/{MAIN_BOT_NAME} ." \
@@ -331,7 +383,7 @@ class TrackedSubreddit(dbobj.Base):
             author_name = author_name.replace("u/", "")
 
         recent_posts = s.query(SubmittedPost).filter(
-            SubmittedPost.subreddit_name.ilike(self.subreddit_name),
+            SubmittedPost.subreddit_name == self.subreddit_name,
             SubmittedPost.author == author_name,
             SubmittedPost.time_utc > datetime.now(pytz.utc) - timedelta(days=182)).all()
         if not recent_posts:
@@ -355,15 +407,15 @@ class TrackedSubreddit(dbobj.Base):
 
     def get_sub_stats(self) -> str:
         total_reviewed = s.query(SubmittedPost) \
-            .filter(SubmittedPost.subreddit_name.ilike(self.subreddit_name)) \
+            .filter(SubmittedPost.subreddit_name == self.subreddit_name) \
             .count()
         total_identified = s.query(SubmittedPost) \
-            .filter(SubmittedPost.subreddit_name.ilike(self.subreddit_name)) \
+            .filter(SubmittedPost.subreddit_name == self.subreddit_name) \
             .filter(SubmittedPost.flagged_duplicate.is_(True)) \
             .count()
 
         authors = s.query(SubmittedPost, func.count(SubmittedPost.author).label('qty')) \
-            .filter(SubmittedPost.subreddit_name.ilike(self.subreddit_name)) \
+            .filter(SubmittedPost.subreddit_name == self.subreddit_name) \
             .group_by(SubmittedPost.author).order_by(desc('qty')).limit(10).all().scalar()
 
         response_lines = ["Stats report for {0} \n\n".format(self.subreddit_name),
@@ -430,8 +482,16 @@ class TrackedSubreddit(dbobj.Base):
         if post_list and "{summary table}" in input_text:
             response_lines = ["\n\n|ID|Time|Author|Title|Status|Counted?|\n"
                               "|:---|:-------|:------|:-----------|:------|:------|\n"]
-            for post in post_list:
-                posted_status = wd.ri.get_posted_status(post) if wd else None
+            # fan the status lookups out at once if the async backend is running
+            posted_statuses = wd.ari.gather(*(wd.ari.get_posted_status(post) for post in post_list)) \
+                if wd and wd.ari else None
+            for j, post in enumerate(post_list):
+                posted_status = posted_statuses[j] if posted_statuses else None
+                if isinstance(posted_status, Exception):  # gather returns failures in place
+                    logger.warning(f"async status lookup failed for {post.id}: {posted_status}")
+                    posted_status = None
+                if not posted_status:
+                    posted_status = wd.ri.get_posted_status(post) if wd else None
                 response_lines.append(
                     f"|{post.id}"
                     f"|{post.time_utc}"
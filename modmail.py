@@ -12,6 +12,7 @@ from settings import MAIN_BOT_NAME, ACCEPTING_NEW_SUBS, BOT_OWNER
 from static import *
 from utils import check_spam_submissions
 from utils import get_subreddit_by_name
+from partitioning import exempt_archived_violations
 from workingdata import WorkingData
 from models.reddit_models.loggedactions import open_logged_action
 
@@ -142,6 +143,7 @@ def handle_dm_command(wd: WorkingData, subreddit_name: str, requestor_name, comm
         if not submission:
             return "Cannot find that submission", True
         submission.mod.approve()
+        wd.ri.invalidate_posted_status(submission.id)
         return "Submission was approved.", False
     elif command == "remove":
         submission_id = parameters[0] if parameters else None
@@ -151,6 +153,7 @@ def handle_dm_command(wd: WorkingData, subreddit_name: str, requestor_name, comm
         if not submission:
             return "Cannot find that submission", True
         submission.mod.remove()
+        wd.ri.invalidate_posted_status(submission.id)
         return "Submission was removed.", True
 
     elif command == "citerule" or command == "testciterule":
@@ -205,8 +208,10 @@ def handle_dm_command(wd: WorkingData, subreddit_name: str, requestor_name, comm
         for post in posts:
             post.flagged_duplicate = False
             # post.counted_status = CountedStatus.EXEMPTED.value
-            post.counted_status_enum = CountedStatus.EXEMPTED
+            post.counted_status_enum = CountedStatus.REVIEWED  # EXEMPTED's old value, no longer flagged
             wd.s.add(post)
+        if REDDITPOST_PARTITIONING:
+            exempt_archived_violations(wd, tr_sub.subreddit_name, author_param)
         wd.s.commit()
     elif command == "reloadconfig":
         wd.ri.reddit_client.subreddit(tr_sub.subreddit_name).wiki.edit(
@@ -539,6 +544,7 @@ def handle_modmail_message(wd: WorkingData, convo):
                             and submission.banned_by and submission.banned_by == "AutoModerator" \
                             and not any(bad_word in submission.selftext for bad_word in bad_words):
                         submission.mod.approve()
+                        wd.ri.invalidate_posted_status(submission.id)
                         response = "Since you contacted the mods this bot " \
                                    "has approved your post on a preliminary basis. " \
                                    " The subreddit moderators may override this decision, however\n\n Your text:\n\n>" \
@@ -550,14 +556,14 @@ def handle_modmail_message(wd: WorkingData, convo):
         if not response:
             # first check if any posts exist for person
             recent_posts: List[SubmittedPost] = wd.s.query(SubmittedPost) \
-                .filter(SubmittedPost.subreddit_name.ilike(subreddit_name)) \
+                .filter(SubmittedPost.subreddit_name == subreddit_name.lower()) \
                 .filter(SubmittedPost.author == initiating_author_name).all()
             removal_reason = None
             # Check again if still no posts in database
             if not recent_posts:
                 check_spam_submissions(wd, sub_list=subreddit_name)
                 recent_posts: List[SubmittedPost] = wd.s.query(SubmittedPost) \
-                    .filter(SubmittedPost.subreddit_name.ilike(subreddit_name)) \
+                    .filter(SubmittedPost.subreddit_name == subreddit_name.lower()) \
                     .filter(SubmittedPost.author == initiating_author_name).all()
             # Collect removal reason if possible from bot comment or mod comment
             last_post = None
@@ -595,7 +601,7 @@ def handle_modmail_message(wd: WorkingData, convo):
             # All reply if specified
             if not response and tr_sub.modmail_all_reply and tr_sub.modmail_all_reply is not True:
                 # response = populate_tags(tr_sub.modmail_all_reply, None, tr_sub=tr_sub, prev_posts=recent_posts)
-                response = tr_sub.populate_tags2(tr_sub.modmail_all_reply, post_list=recent_posts)
+                response = tr_sub.populate_tags2(tr_sub.modmail_all_reply, post_list=recent_posts, wd=wd)
             # No links auto reply if specified
             if not response and tr_sub.modmail_no_link_reply:
                 import re
@@ -603,7 +609,7 @@ def handle_modmail_message(wd: WorkingData, convo):
                 if len(urls) < 2:  # both link and link description
                     # response = populate_tags(tr_sub.modmail_no_link_reply, None, tr_sub=tr_sub,
                     # prev_posts=recent_posts)
-                    response = tr_sub.populate_tags2(tr_sub.modmail_no_link_reply, post_list=recent_posts)
+                    response = tr_sub.populate_tags2(tr_sub.modmail_no_link_reply, post_list=recent_posts, wd=wd)
                     # Add last found link
                     if recent_posts:
                         response += f"\n\nAre you by chance referring to this post? " \
@@ -647,13 +653,13 @@ def handle_modmail_message(wd: WorkingData, convo):
                         f"[$remove {last_post.id}]({smart_link}$remove {last_post.id}) | "
                         f"\n\nDO NOT CLICK ON LinkedIn LINKS OR URL shorteners - they have been used to dox moderators."
                         f"\n\nPlease subscribe to /r/ModeratelyHelpfulBot for updates.\n\n", None,
-                        post_list=recent_posts)
+                        post_list=recent_posts, wd=wd)  # wd: its status lookups fan out on wd.ari
 
                     response_internal = True
                 # Reply using a specified template
                 else:  # given a response to say -> not internal
                     # response = populate_tags(tr_sub.modmail_posts_reply, None, prev_posts=recent_posts)
-                    response = tr_sub.populate_tags2(tr_sub.modmail_posts_reply, post_list=recent_posts)
+                    response = tr_sub.populate_tags2(tr_sub.modmail_posts_reply, post_list=recent_posts, wd=wd)
 
             # No posts reply
             elif not response and not recent_posts and tr_sub.modmail_no_posts_reply:
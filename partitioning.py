@@ -0,0 +1,174 @@
+#!/usr/bin/env python3.7
+"""Optional time_utc range partitioning for RedditPost, purged by dropping whole partitions.
+
+Dropping a partition is a metadata operation, so the purge takes about the same time whatever the table size.
+Rows that still matter are moved to RedditPostArchive first, and a partition is only dropped once they're all
+there:
+ - flagged_duplicate / pre_duplicate posts (the old purge never deleted these) - the ban threshold count and
+   the $reset command look in the archive too, see archived_violations
+ - stragglers of subs whose interval is longer than PARTITION_MAX_RETENTION_DAYS
+
+Partitions are kept until every active sub's interval has passed (at least PARTITION_RETENTION_DAYS), so the
+frequency checks only lose sight of posts from subs with intervals over the cap.
+
+One-time conversion (MySQL needs time_utc in the primary key, so it becomes (id, time_utc)):
+
+    python3 partitioning.py enable daily|weekly
+
+then set REDDITPOST_PARTITIONING in static.py to match.
+"""
+import sys
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+from core import dbobj
+from enums import CountedStatus
+from logger import logger
+from models.reddit_models import SubmittedPost
+from static import PARTITION_MAX_RETENTION_DAYS, PARTITION_RETENTION_DAYS, PARTITIONS_AHEAD
+
+ARCHIVE_TABLE = "RedditPostArchive"
+MAXVALUE_PARTITION = "pmax"
+
+
+def period_start(dt: datetime, granularity: str) -> datetime:
+    day = datetime(dt.year, dt.month, dt.day)
+    if granularity == "weekly":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def period_length(granularity: str) -> timedelta:
+    return timedelta(weeks=1) if granularity == "weekly" else timedelta(days=1)
+
+
+def partition_definitions(first: datetime, last: datetime, granularity: str) -> List[str]:
+    # named for the first day each holds, bounded by the next period's start
+    definitions = []
+    start = period_start(first, granularity)
+    while start <= last:
+        end = start + period_length(granularity)
+        definitions.append(f"PARTITION p{start:%Y%m%d} VALUES LESS THAN ('{end:%Y-%m-%d %H:%M:%S}')")
+        start = end
+    return definitions
+
+
+def get_partitions(engine) -> List[Tuple[str, datetime]]:
+    # (name, upper bound), oldest first; pmax is left out
+    rs = engine.execute("SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+                        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'RedditPost' "
+                        "AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION")
+    partitions = []
+    for name, description in rs:
+        if name == MAXVALUE_PARTITION:
+            continue
+        partitions.append((name, datetime.strptime(description.strip("'"), "%Y-%m-%d %H:%M:%S")))
+    return partitions
+
+
+def ensure_archive_table(engine):
+    engine.execute(f"CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} LIKE RedditPost")
+    rs = engine.execute("SELECT COUNT(*) FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = DATABASE() "
+                        f"AND TABLE_NAME = '{ARCHIVE_TABLE}' AND PARTITION_NAME IS NOT NULL")
+    if rs.scalar():  # LIKE copies the partitioning, the archive doesn't need it
+        engine.execute(f"ALTER TABLE {ARCHIVE_TABLE} REMOVE PARTITIONING")
+
+
+def archived_violations(wd, subreddit_name: str, author: str, before: datetime) -> List[SubmittedPost]:
+    # FLAGGED posts that went to the archive with their partition, for the ban threshold count. Returned
+    # detached: they have no RedditPost row to flush changes to. Ones still in RedditPost (archived, partition
+    # not dropped yet) are left out so they aren't counted twice
+    posts = wd.s.query(SubmittedPost).from_statement(text(
+        f"SELECT a.* FROM {ARCHIVE_TABLE} a WHERE a.subreddit_name = :subreddit_name AND a.author = :author "
+        "AND a.counted_status_enum = :flagged AND a.time_utc < :before "
+        "AND NOT EXISTS (SELECT 1 FROM RedditPost t WHERE t.id = a.id)")).params(
+        subreddit_name=subreddit_name, author=author, flagged=CountedStatus.FLAGGED.name, before=before).all()
+    for post in posts:
+        wd.s.expunge(post)
+    return posts
+
+
+def exempt_archived_violations(wd, subreddit_name: str, author: str) -> int:
+    # $reset: same as for the live posts, so archived ones stop counting too
+    return wd.s.execute(text(
+        f"UPDATE {ARCHIVE_TABLE} SET flagged_duplicate = 0, counted_status_enum = :reviewed "
+        "WHERE subreddit_name = :subreddit_name AND author = :author AND counted_status_enum = :flagged"),
+        dict(reviewed=CountedStatus.REVIEWED.name, flagged=CountedStatus.FLAGGED.name,
+             subreddit_name=subreddit_name, author=author)).rowcount
+
+
+def enable_partitioning(engine, granularity: str):
+    # time_utc joins the primary key, which can't hold NULLs: date those rows by when they were added instead
+    backfilled = engine.execute("UPDATE RedditPost SET time_utc = COALESCE(added_time, last_checked) "
+                                "WHERE time_utc IS NULL").rowcount
+    deleted = engine.execute("DELETE FROM RedditPost WHERE time_utc IS NULL").rowcount
+    if backfilled or deleted:
+        logger.info(f"{backfilled} post(s) without time_utc dated by added_time, {deleted} undatable deleted")
+    oldest = engine.execute("SELECT MIN(time_utc) FROM RedditPost").scalar() or datetime.utcnow()
+    definitions = partition_definitions(oldest, datetime.utcnow() + timedelta(days=PARTITIONS_AHEAD), granularity)
+    definitions.append(f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE)")
+    logger.info(f"partitioning RedditPost {granularity} into {len(definitions)} partitions, this rebuilds the table")
+    engine.execute("ALTER TABLE RedditPost DROP PRIMARY KEY, ADD PRIMARY KEY (id, time_utc)")
+    engine.execute(f"ALTER TABLE RedditPost PARTITION BY RANGE COLUMNS(time_utc) ({', '.join(definitions)})")
+    ensure_archive_table(engine)
+
+
+def add_future_partitions(engine, granularity: str):
+    # split the new periods out of pmax while it's still empty
+    partitions = get_partitions(engine)
+    if not partitions:
+        return
+    newest_bound = partitions[-1][1]
+    definitions = partition_definitions(newest_bound, datetime.utcnow() + timedelta(days=PARTITIONS_AHEAD),
+                                        granularity)
+    if not definitions:
+        return
+    definitions.append(f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE)")
+    engine.execute(f"ALTER TABLE RedditPost REORGANIZE PARTITION {MAXVALUE_PARTITION} INTO ({', '.join(definitions)})")
+    logger.info(f"added {len(definitions) - 1} future partition(s)")
+
+
+def purge_partitions(wd, granularity: str):
+    tick = datetime.now()
+    engine = wd.s.get_bind()
+    longest_interval_mins = wd.s.execute("SELECT MAX(min_post_interval_mins) FROM TrackedSubs "
+                                         "WHERE active_status_enum IN ('ACTIVE', 'NO_BAN_ACCESS')").scalar() or 0
+    retention = max(timedelta(days=PARTITION_RETENTION_DAYS), timedelta(minutes=longest_interval_mins))
+    retention = min(retention, timedelta(days=PARTITION_MAX_RETENTION_DAYS))
+    cutoff = datetime.utcnow() - retention
+
+    ensure_archive_table(engine)
+    dropped = 0
+    for name, upper_bound in get_partitions(engine):
+        if upper_bound > cutoff:
+            break
+        partition_rows = f"FROM RedditPost PARTITION ({name}) t " \
+                         "LEFT JOIN TrackedSubs s ON t.subreddit_name = s.subreddit_name"
+        keep = "WHERE t.flagged_duplicate = 1 OR t.pre_duplicate = 1 " \
+               "OR t.time_utc > utc_timestamp() - INTERVAL s.min_post_interval_mins MINUTE"
+        with engine.begin() as connection:
+            connection.execute(f"INSERT IGNORE INTO {ARCHIVE_TABLE} SELECT t.* {partition_rows} {keep}")
+        # DROP PARTITION can't share a transaction with the copy, so check every row made it before dropping;
+        # rerunning is safe, INSERT IGNORE skips what's already archived
+        to_keep, archived = engine.execute(
+            f"SELECT COUNT(*), COUNT(a.id) {partition_rows} "
+            f"LEFT JOIN {ARCHIVE_TABLE} a ON a.id = t.id AND a.time_utc = t.time_utc {keep}").fetchone()
+        if to_keep != archived:
+            logger.error(f"partition {name}: only {archived} of {to_keep} post(s) to keep are archived, not dropping")
+            break
+        engine.execute(f"ALTER TABLE RedditPost DROP PARTITION {name}")
+        dropped += 1
+        logger.info(f"dropped partition {name} (< {upper_bound}), archived {archived} post(s)")
+
+    add_future_partitions(engine, granularity)
+    logger.info(f"partition purge: dropped {dropped} partition(s), retention {retention}, "
+                f"took {datetime.now() - tick}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != "enable" or sys.argv[2] not in ("daily", "weekly"):
+        print("usage: python3 partitioning.py enable daily|weekly")
+        sys.exit(1)
+    enable_partitioning(dbobj.engine, sys.argv[2])
@@ -0,0 +1,71 @@
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, text
+
+from logger import logger
+from models.reddit_models import Task
+from static import PURGE_BATCH_SIZE, PURGE_BATCH_SLEEP_SECS, PURGE_INTERVAL_HRS, PURGE_TICK_BUDGET_SECS
+
+# same rule as the old single DELETE: past the sub's interval (at least 10 days) and never flagged
+PURGE_SELECT = "SELECT t.id FROM RedditPost t INNER JOIN TrackedSubs s ON t.subreddit_name = s.subreddit_name " \
+               "WHERE t.id > :checkpoint " \
+               "AND t.time_utc < utc_timestamp() - INTERVAL greatest(s.min_post_interval_mins, 60*24*10) MINUTE " \
+               "AND t.flagged_duplicate = 0 AND t.pre_duplicate = 0 " \
+               "ORDER BY t.id LIMIT :batch_size"
+PURGE_DELETE = text("DELETE FROM RedditPost WHERE id IN :post_ids").bindparams(bindparam("post_ids", expanding=True))
+
+
+class ChunkedPurge:
+    """Deletes expired RedditPost rows in primary key order, a few batches per scheduler tick.
+
+    Each batch is its own short transaction, so locks are held for one batch at a time rather than one
+    table-wide DELETE. The checkpoint is the last id deleted; the next tick picks up after it and a finished
+    pass waits PURGE_INTERVAL_HRS before starting again from the beginning. Both are kept on the purge task's
+    aa_tasks row, committed with each batch, so a restart carries on where the last run left off.
+    """
+
+    def __init__(self, task_name="purge_old_records"):
+        self.task_name = task_name
+        self.pass_started_dt = None
+        self.pass_deleted = 0
+
+    def run_tick(self, wd):
+        state: Task = wd.s.query(Task).get(self.task_name)  # the scheduler's row, already in the session
+        if state.next_pass and datetime.now() < state.next_pass:
+            return
+        if not self.pass_started_dt:
+            self.pass_started_dt = datetime.now()
+            self.pass_deleted = 0
+            if state.checkpoint:
+                logger.info(f"purge: resuming pass after {state.checkpoint}")
+            else:
+                logger.info("purge: starting pass")
+
+        tick = datetime.now()
+        while datetime.now() - tick < timedelta(seconds=PURGE_TICK_BUDGET_SECS):
+            batch_tick = datetime.now()
+            checkpoint = state.checkpoint or ""
+            post_ids = [row[0] for row in wd.s.execute(PURGE_SELECT, {"checkpoint": checkpoint,
+                                                                      "batch_size": PURGE_BATCH_SIZE})]
+            if post_ids:
+                wd.s.execute(PURGE_DELETE, {"post_ids": post_ids})
+            self.pass_deleted += len(post_ids)
+            finished = len(post_ids) < PURGE_BATCH_SIZE
+            if finished:
+                self.finish_pass(state)
+            else:
+                state.checkpoint = post_ids[-1]
+            wd.s.commit()  # the batch and the checkpoint past it together
+            logger.debug(f"purge: batch deleted {len(post_ids)} rows in {datetime.now() - batch_tick}, "
+                         f"checkpoint {checkpoint or '-'} -> {post_ids[-1] if post_ids else 'end'}")
+            if finished:
+                return
+            time.sleep(PURGE_BATCH_SLEEP_SECS)  # let the minute-level tasks get their writes in
+
+    def finish_pass(self, state: Task):
+        logger.info(f"purge: pass complete, deleted {self.pass_deleted} rows in "
+                    f"{datetime.now() - self.pass_started_dt}")
+        state.checkpoint = None
+        state.next_pass = datetime.now() + timedelta(hours=PURGE_INTERVAL_HRS)
+        self.pass_started_dt = None
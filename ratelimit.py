@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import Counter
+
+from logger import logger
+from static import RATELIMIT_BURST, RATELIMIT_DEFAULT_PRIORITY, RATELIMIT_RESERVES, RATELIMIT_WINDOW_REQUESTS, \
+    RATELIMIT_WINDOW_SECS
+
+
+class RateLimitGovernor:
+    """Shares reddit's per-window request budget between the task lanes, by priority.
+
+    Every response's X-Ratelimit-Remaining/-Reset resets the bucket, and each request takes a token before it's
+    sent, so concurrent threads don't overspend between responses. A priority may only spend the bucket down to
+    its reserve (RATELIMIT_RESERVES, a share of the window): bulk work stops first and waits for the reset,
+    while critical work (removals, modmail) can use the whole window. Priorities with a reserve also draw from a
+    token bucket of their own, refilled at the rate that makes their share last until the reset, so they slow
+    down smoothly rather than spend it in one burst.
+
+    The priority is per thread - the scheduler sets it for each task, worker pools copy their caller's.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.local = threading.local()
+        self.window_requests = float(RATELIMIT_WINDOW_REQUESTS)
+        self.remaining = self.window_requests
+        self.reset_at = time.monotonic() + RATELIMIT_WINDOW_SECS
+        self.tokens = {}  # priority -> tokens in its bucket, only for priorities with a reserve
+        self.refilled_at = {}  # priority -> monotonic time its bucket was last topped up
+        self.wait_secs = Counter()  # priority -> time spent waiting for tokens, see pop_wait_secs
+
+    def install(self, reddit_client):
+        # prawcore asks its RateLimiter to delay() before each request and update() after - take over the first,
+        # listen in on the second
+        for core in {id(core): core for core in (getattr(reddit_client, attr, None) for attr in
+                                                 ("_core", "_authorized_core", "_read_only_core")) if core}.values():
+            limiter = getattr(core, "_rate_limiter", None)
+            if not limiter:
+                logger.warning("rate limit governor: prawcore has no _rate_limiter, not installed")
+                continue
+            original_update = limiter.update
+
+            def update(*args, original_update=original_update, **kwargs):
+                # forwarded as given: response_headers is positional before prawcore 3, keyword-only since
+                original_update(*args, **kwargs)
+                self.update(kwargs["response_headers"] if "response_headers" in kwargs else args[0])
+
+            limiter.update = update
+            limiter.delay = self.acquire
+
+    def set_priority(self, priority: str):
+        self.local.priority = priority
+
+    def current_priority(self) -> str:
+        return getattr(self.local, "priority", RATELIMIT_DEFAULT_PRIORITY)
+
+    def update(self, response_headers):
+        remaining = response_headers.get("x-ratelimit-remaining")
+        reset = response_headers.get("x-ratelimit-reset")
+        used = response_headers.get("x-ratelimit-used")
+        if remaining is None or reset is None:
+            return
+        with self.condition:
+            self.remaining = float(remaining)
+            self.reset_at = time.monotonic() + float(reset)
+            if used is not None:
+                self.window_requests = float(used) + float(remaining)
+            self.condition.notify_all()
+
+    def next_grant_in(self, priority: str, now: float) -> float:
+        if now >= self.reset_at:  # window rolled over without a response to say so
+            self.remaining = self.window_requests
+            self.reset_at = now + RATELIMIT_WINDOW_SECS
+        reserve = RATELIMIT_RESERVES.get(priority, 0) * self.window_requests
+        if self.remaining - 1 < reserve:
+            return self.reset_at - now
+        if not reserve:
+            return 0
+        # the priority's own bucket refills at the rate that spreads what's left above its reserve over the rest
+        # of the window, and holds up to RATELIMIT_BURST tokens
+        rate = (self.remaining - reserve) / max(self.reset_at - now, 1)
+        tokens = self.tokens.get(priority, RATELIMIT_BURST)
+        tokens = min(RATELIMIT_BURST, tokens + rate * (now - self.refilled_at.get(priority, now)))
+        self.tokens[priority] = tokens
+        self.refilled_at[priority] = now
+        return 0 if tokens >= 1 else (1 - tokens) / rate
+
+    def acquire(self):
+        priority = self.current_priority()
+        started = time.monotonic()
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                wait = self.next_grant_in(priority, now)
+                if wait <= 0:
+                    break
+                self.condition.wait(wait)  # woken early when a response refreshes the bucket
+            self.remaining -= 1
+            if priority in self.tokens:
+                self.tokens[priority] -= 1
+            self.wait_secs[priority] += now - started
+
+    def pop_wait_secs(self, priority: str) -> float:
+        with self.condition:
+            return self.wait_secs.pop(priority, 0)
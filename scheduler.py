@@ -0,0 +1,192 @@
+import signal
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+import prawcore
+
+from core import dbobj
+from logger import logger
+from memory import MemoryReport, current_rss_mb, end_of_task
+from models.reddit_models import Task
+from static import LANE_METRICS_INTERVAL_MINS, TASK_BACKOFF_BASE_SECS, TASK_BACKOFF_MAX_SECS, TASK_MAX_SLEEP_SECS
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise TaskTimeout()
+
+
+class ScheduledTask:
+    """One scheduled function plus its aa_tasks row, which holds last run, errors and backoff across restarts."""
+
+    def __init__(self, name: str, function: Callable, frequency: timedelta, max_duration: timedelta,
+                 priority: str = None):
+        self.name = name
+        self.function = function
+        self.frequency = frequency
+        self.max_duration = max_duration
+        self.priority = priority  # reddit rate limit priority, defaults to the lane's name
+        self.state: Task = None
+
+    def next_due(self) -> datetime:
+        if self.state.force_run or not self.state.last_ran:
+            return datetime.now()
+        due = self.state.last_ran + self.frequency
+        if self.state.next_run and self.state.next_run > due:  # backing off
+            return self.state.next_run
+        return due
+
+
+class Scheduler:
+    """Runs whichever task is due next and sleeps until the one after, instead of spinning through the list.
+
+    A task that raises or runs past its max_duration backs off on its own (doubling from TASK_BACKOFF_BASE_SECS),
+    without holding up the others. max_duration is enforced with SIGALRM when running on the main thread; other
+    lanes can't interrupt a task, so there an overrun is only logged - a task that returned has finished and
+    committed its work, and isn't rolled back or backed off.
+
+    Each Scheduler is a lane: its own thread and wd. Queueing delay (how long a task waited past due) is tracked
+    per lane and any wait over the lane's deadline is logged as a miss.
+
+    Every task run is one unit of work: the lane's subs are attached to this thread's session beforehand and
+    the session is ended afterwards, so nothing loaded during the task stays in an identity map.
+    """
+
+    def __init__(self, wd, tasks: List[ScheduledTask], name="main", deadline=timedelta(minutes=5),
+                 on_start: Callable = None):
+        self.wd = wd
+        self.tasks = tasks
+        self.name = name
+        self.deadline = deadline
+        self.on_start = on_start
+        self.queue_delays: List[float] = []
+        self.deadline_misses = 0
+        self.metrics_logged_dt = datetime.now()
+
+    def start(self):
+        # on the lane's own thread, so everything loaded here belongs to its session
+        for task in self.tasks:
+            task.state = self.wd.s.query(Task).get(task.name)
+            if not task.state:
+                task.state = Task(task.name, int(task.frequency.total_seconds()))
+            task.state.run_interval = int(task.frequency.total_seconds())
+            self.wd.s.add(task.state)
+        if self.on_start:
+            self.on_start(self.wd)
+        self.wd.s.commit()
+        dbobj.end_session()
+
+    def attach(self):
+        # re-attach what the lane keeps between tasks - no sql, just back into the identity map
+        self.wd.s.add_all(list(self.wd.sub_dict.values()))
+        self.wd.s.add_all([task.state for task in self.tasks])
+
+    def run_forever(self):
+        self.start()
+        while True:
+            self.run_due()
+            next_due = min(task.next_due() for task in self.tasks)
+            wait_secs = (next_due - datetime.now()).total_seconds()
+            if wait_secs > 0:
+                logger.debug(f"lane {self.name}: sleeping {wait_secs:.0f}s")
+                time.sleep(min(wait_secs, TASK_MAX_SLEEP_SECS))
+
+    def run_due(self):
+        for task in sorted(self.tasks, key=lambda t: t.next_due()):
+            due = task.next_due()
+            if due <= datetime.now():
+                self.record_queue_delay(task, datetime.now() - due)
+                self.run_task(task)
+        if datetime.now() - self.metrics_logged_dt > timedelta(minutes=LANE_METRICS_INTERVAL_MINS):
+            self.log_metrics()
+
+    def record_queue_delay(self, task: ScheduledTask, delay: timedelta):
+        self.queue_delays.append(delay.total_seconds())
+        if delay > self.deadline:
+            self.deadline_misses += 1
+            logger.warning(f"lane {self.name}: {task.name} started {delay} late (deadline {self.deadline})")
+
+    def log_metrics(self):
+        if self.queue_delays:
+            delays = sorted(self.queue_delays)
+            logger.info(f"lane {self.name}: {len(delays)} runs, queue delay avg {sum(delays) / len(delays):.1f}s "
+                        f"p95 {delays[int(len(delays) * .95)]:.1f}s max {delays[-1]:.1f}s, "
+                        f"{self.deadline_misses} deadline misses, rss {current_rss_mb():.0f}MB"
+                        f"{self.rate_limit_summary()}")
+        self.queue_delays = []
+        self.deadline_misses = 0
+        self.metrics_logged_dt = datetime.now()
+
+    def rate_limit_summary(self) -> str:
+        if not self.wd.ri:
+            return ""
+        priorities = {task.priority or self.name for task in self.tasks}
+        return ", rate limit wait " + " ".join(f"{priority} {self.wd.ri.rate_limiter.pop_wait_secs(priority):.0f}s"
+                                                for priority in sorted(priorities))
+
+    def run_task(self, task: ScheduledTask):
+        state = task.state
+        start_time = datetime.now()
+        log_str = f"{task.name}, last ran:{state.last_ran}"
+        logger.debug(f"Running task ({self.name} lane): {log_str}")
+        use_alarm = threading.current_thread() is threading.main_thread()
+        if self.wd.ri:
+            self.wd.ri.rate_limiter.set_priority(task.priority or self.name)
+        self.attach()
+        memory_report = MemoryReport(self.wd.s)
+        try:
+            if use_alarm:
+                signal.signal(signal.SIGALRM, _raise_timeout)
+                signal.setitimer(signal.ITIMER_REAL, task.max_duration.total_seconds())
+            task.function(self.wd)
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            duration = datetime.now() - start_time
+            overran = f" (over max {task.max_duration})" if duration > task.max_duration else ""
+            if overran:
+                logger.warning(f"lane {self.name}: {task.name} ran {duration}{overran}")
+            state.error_count = 0
+            state.next_run = None
+            state.last_report = f"ok in {duration}{overran}, {memory_report.finish()}"
+            logger.debug(f"Task complete {task.name} {duration} {memory_report}")
+        except Exception as e:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            self.wd.s.rollback()
+            state.error_count += 1
+            backoff_secs = min(TASK_BACKOFF_BASE_SECS * 2 ** (state.error_count - 1), TASK_BACKOFF_MAX_SECS)
+            state.next_run = datetime.now() + timedelta(seconds=backoff_secs)
+            if isinstance(e, TaskTimeout):
+                state.last_error = f"timed out after {datetime.now() - start_time} (max {task.max_duration})"
+            else:
+                state.last_error = traceback.format_exc()
+            if isinstance(e, (prawcore.exceptions.ServerError, prawcore.exceptions.ResponseException)):
+                logger.warning(f"Reddit error in {task.name}, backing off {backoff_secs}s: {e}")
+            else:
+                logger.warning(f"Task {task.name} failed ({state.error_count} in a row), "
+                               f"backing off {backoff_secs}s\n{state.last_error}")
+        state.last_ran = start_time
+        state.last_duration = int((datetime.now() - start_time).total_seconds())
+        state.force_run = False
+        try:
+            self.wd.s.add(state)
+            self.wd.s.commit()
+        except Exception:
+            self.wd.s.rollback()
+            logger.warning(f"could not save task state for {task.name}\n{traceback.format_exc()}")
+        finally:
+            end_of_task(self.wd.s, task.name)
+            dbobj.end_session()  # end of the unit of work
+
+
+def run_lanes(lanes: List[Scheduler]):
+    # the first lane keeps the main thread (and hard timeouts), the rest get a thread each
+    for lane in lanes[1:]:
+        threading.Thread(target=lane.run_forever, name=f"lane-{lane.name}", daemon=True).start()
+    lanes[0].run_forever()
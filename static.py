@@ -35,7 +35,51 @@ RESPONSE_TAIL = """
 MAIN_SETTINGS = dict()
 WATCHED_SUBS = dict()
 SUBWIKI_CHECK_INTERVAL_HRS = 24
+CONFIG_CHECK_JITTER = 0.25  # +/- share of SUBWIKI_CHECK_INTERVAL_HRS added to each sub's next config check
+CONFIG_FULL_REFRESH_DAYS = 7  # mod list and config refetched regardless of the wiki revision after this long
+CONFIG_REFRESH_INTERVAL_MINS = 10  # how often the bulk lane refreshes whichever subs are due
+CONFIG_REFRESH_BATCH_SIZE = 100  # max subs refreshed per run
 UPDATE_LIST = True
+REDDIT_BACKEND = "sync"  # "async" also starts an asyncpraw client (wd.ari) for fanning out api calls
+FREQUENCY_ENGINE_MODE = "shadow"  # "off", "shadow" (sql decides, engine is compared) or "on"
+NEW_LISTING_OVERLAP_MINS = 5  # rescan this far behind a listing's mark, posts can show up in /new a bit late
+CHECK_SUBMISSIONS_WORKERS = 4  # threads fetching sub listings in check_submissions, 1 = serial
+POSTED_STATUS_CACHE_TTL_SECS = 300  # how long a fetched posted status/api handle is reused
+POSTED_STATUS_CACHE_SIZE = 20000  # max posts kept in the posted status cache
+EXEMPTION_INPUT_MAX_AGE_MINS = 180  # stored posted status/flairs younger than this are trusted by the exemption check
+KNOWN_ID_CHUNK_SIZE = 500  # max ids per IN (...) lookup when checking for known posts
+BULK_INGEST = True  # insert new posts with one executemany instead of ORM objects (nsfw-monitored subs excepted)
+REDDITPOST_PARTITIONING = None  # None, "daily" or "weekly" - must match what partitioning.py enabled
+PARTITION_RETENTION_DAYS = 10  # partitions are dropped once past this and every active sub's interval...
+PARTITION_MAX_RETENTION_DAYS = 45  # ...up to this, longer-interval stragglers are moved to the archive
+PARTITIONS_AHEAD = 7  # empty future partitions kept ready
+PURGE_MODE = "chunked"  # "chunked" (batches spread over ticks) or "single" (one DELETE), unused when partitioned
+PURGE_INTERVAL_HRS = 12  # time between purge passes
+PURGE_BATCH_SIZE = 2000  # rows deleted per batch/transaction
+PURGE_BATCH_SLEEP_SECS = 0.5  # pause between batches
+PURGE_TICK_BUDGET_SECS = 10  # max time spent purging per scheduler tick, resumes from checkpoint next tick
+TASK_BACKOFF_BASE_SECS = 60  # first retry delay after a task fails, doubles per consecutive failure
+TASK_BACKOFF_MAX_SECS = 60 * 60  # cap on a task's backoff
+TASK_MAX_SLEEP_SECS = 30  # longest the scheduler sleeps before rechecking
+DB_POOL_SIZE = 5  # pooled connections kept open, one per lane plus headroom
+DB_MAX_OVERFLOW = 5  # extra connections allowed under load
+DB_POOL_RECYCLE_SECS = 60 * 60  # replace connections before mysql's wait_timeout drops them
+SESSION_MAX_OBJECTS = 50000  # warn when a task ends holding more objects than this in its session
+TASK_LANES = True  # run the critical/ingest/bulk task lanes on their own threads, False = one serial lane
+LANE_DEADLINES_SECS = {"critical": 60, "ingest": 180, "bulk": 60 * 60}  # queueing delay before a task is late
+LANE_METRICS_INTERVAL_MINS = 30  # how often each lane logs its queueing delay summary
+RATELIMIT_WINDOW_REQUESTS = 600  # reddit's requests per window until the X-Ratelimit headers say otherwise
+RATELIMIT_WINDOW_SECS = 600
+RATELIMIT_RESERVES = {"critical": 0, "ingest": 0.1, "bulk": 0.3}  # share of the window a priority leaves unspent
+RATELIMIT_BURST = 10  # requests a paced (ingest/bulk) priority may send back to back
+RATELIMIT_DEFAULT_PRIORITY = "ingest"  # for threads that never set one
+ACTION_QUEUE_WORKERS = 4  # threads running queued reddit actions (removals, replies, bans, modmail...)
+ACTION_QUEUE_BATCH_SIZE = 100  # max actions claimed per round, each round's results are committed together
+ACTION_QUEUE_DRAIN_BUDGET_SECS = 120  # rounds continue (replies after removals, backlogs) until this is spent
+ACTION_RETRY_BASE_SECS = 60  # first retry delay after a transient failure, doubles per try
+ACTION_RETRY_MAX_SECS = 60 * 60  # cap on an action's retry delay
+ACTION_MAX_TRIES = 5  # attempts before an action is marked failed
+ACTION_QUEUE_RETENTION_DAYS = 14  # finished actions kept this long, so re-queueing them stays a no-op
 ACTIVE_SUB_LIST = []
 NEW_SUBMISSION_Q = queue.Queue()
 SPAM_SUBMISSION_Q = queue.Queue()
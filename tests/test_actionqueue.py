@@ -0,0 +1,167 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+import prawcore
+import pytz
+
+from actionqueue import EXECUTORS, drain_round, enqueue_action, run_action
+from enums import ActionStatus
+from models.reddit_models import LoggedAction
+from utils import check_for_actionable_violations, queue_modmail
+
+
+class FakeQuery:
+    def __init__(self, session, model):
+        self.session = session
+        self.model = model
+
+    def get(self, key):
+        if self.model is LoggedAction:
+            return self.session.actions.get((key["action_type"], key["action_id"]))
+        return None
+
+    def filter(self, *criteria):
+        return self
+
+    def order_by(self, *criteria):
+        return self
+
+    def limit(self, count):
+        return self
+
+    def all(self):
+        # the claim query is the only LoggedAction one that gets this far - what's queued and due, oldest first
+        if self.model is not LoggedAction:
+            return []
+        now = datetime.now()
+        due = [logged_action for logged_action in self.session.actions.values()
+               if logged_action.action_status_enum == ActionStatus.QUEUED and logged_action.next_attempt <= now]
+        return sorted(due, key=lambda logged_action: logged_action.next_attempt)
+
+
+class FakeSession:
+    def __init__(self):
+        self.actions = {}
+
+    def query(self, model):
+        return FakeQuery(self, model)
+
+    def add(self, obj):
+        if isinstance(obj, LoggedAction):
+            self.actions[(obj.action_type, obj.action_id)] = obj
+
+    def commit(self):
+        pass
+
+
+def make_sub():
+    return SimpleNamespace(subreddit_name="testsub", mm_convo_id=None, ban_duration_days=3, ban_ability=1,
+                           ban_threshold_count=0, max_count_per_interval=1, min_post_interval=timedelta(hours=24),
+                           grace_period=timedelta(minutes=30), ignore_moderator_removed=True,
+                           notify_about_spammers=False)
+
+
+def make_post():
+    return SimpleNamespace(id="abc123", author="someone", subreddit_name="testsub",
+                           time_utc=datetime.now(pytz.utc).replace(tzinfo=None))
+
+
+def test_each_action_type_enqueues_and_runs():
+    wd = SimpleNamespace(s=FakeSession())
+    tr_sub, post = make_sub(), make_post()
+    # the call sites that pass a subreddit_name payload alongside the row's subreddit
+    queue_modmail(wd, tr_sub, "abc123-modmail", "subject", "body")
+    check_for_actionable_violations(tr_sub, post, [post], wd=wd)
+    # and the rest, as utils queues them
+    enqueue_action(wd, "remove", post.id, tr_sub.subreddit_name, post_id=post.id, blacklist=False,
+                   distinguish=False, approve=False, lock_thread=True)
+    enqueue_action(wd, "reply", post.id, tr_sub.subreddit_name, post_id=post.id, body="reply",
+                   distinguish=False, approve=False, lock_thread=False)
+    enqueue_action(wd, "report", post.id, tr_sub.subreddit_name, post_id=post.id, reason="too many posts")
+    enqueue_action(wd, "message", f"{post.id}-violation", tr_sub.subreddit_name, author=post.author,
+                   subject="subject", body="body")
+    assert {action_type for action_type, _ in wd.s.actions} == set(EXECUTORS)
+
+    ri = SimpleNamespace(reddit_client=mock.MagicMock(), bot_name="testbot")
+    for logged_action in wd.s.actions.values():
+        assert logged_action.subreddit_name == "testsub"
+        run_action(ri, logged_action.action_type, json.loads(logged_action.payload), False)
+    ri.reddit_client.subreddit.assert_any_call("testsub")
+    ri.reddit_client.subreddit.return_value.banned.add.assert_called_once()
+    ri.reddit_client.subreddit.return_value.message.assert_called_once()
+    ri.reddit_client.submission.return_value.mod.remove.assert_called_once()
+    ri.reddit_client.submission.return_value.reply.assert_called_once()
+    ri.reddit_client.submission.return_value.report.assert_called_once()
+    ri.reddit_client.redditor.return_value.message.assert_called_once()
+
+
+def test_enqueue_is_idempotent():
+    wd = SimpleNamespace(s=FakeSession())
+    first = enqueue_action(wd, "remove", "abc123", "testsub", post_id="abc123")
+    assert enqueue_action(wd, "remove", "abc123", "testsub", post_id="abc123") is first
+
+
+def make_wd():
+    return SimpleNamespace(s=FakeSession(), ri=SimpleNamespace(reddit_client=mock.MagicMock(), bot_name="testbot"))
+
+
+def queue(wd, action_type, action_id, **payload):
+    logged_action = enqueue_action(wd, action_type, action_id, "testsub", **payload)
+    logged_action.action_try_count = 0
+    logged_action.next_attempt = datetime.now() - timedelta(seconds=1)
+    return logged_action
+
+
+def drain(wd, on_done=None, on_failed=None):
+    with ThreadPoolExecutor(2) as executor:
+        return drain_round(wd, executor, on_done or mock.Mock(), on_failed or mock.Mock())
+
+
+def test_failed_ban_does_not_hold_up_the_removal():
+    wd = make_wd()
+    ban = queue(wd, "ban", "abc123-ban", post_id="abc123", subreddit_name="testsub", author="someone", note="",
+                ban_reason="", ban_message="")
+    remove = queue(wd, "remove", "abc123", post_id="abc123")
+    wd.ri.reddit_client.subreddit.return_value.banned.add.side_effect = \
+        prawcore.exceptions.Forbidden(mock.Mock(status_code=403))
+    on_failed = mock.Mock()
+    counts = drain(wd, on_failed=on_failed)
+    assert counts == {"done": 1, "failed": 1}
+    assert remove.action_status_enum == ActionStatus.DONE
+    assert ban.action_status_enum == ActionStatus.FAILED
+    on_failed.assert_called_once()
+
+
+def test_reply_waits_for_the_removal_across_rounds():
+    wd = make_wd()
+    remove = queue(wd, "remove", "abc123", post_id="abc123")
+    reply = queue(wd, "reply", "abc123", post_id="abc123", body="reply")
+    wd.ri.reddit_client.submission.return_value.mod.remove.side_effect = \
+        prawcore.exceptions.ServerError(mock.Mock(status_code=500))
+    assert drain(wd) == {"retry": 1, "waiting": 1}
+    assert reply.action_status_enum == ActionStatus.QUEUED and reply.next_attempt > datetime.now()
+
+    # the removal's retry comes due first, the reply only once it's done
+    wd.ri.reddit_client.submission.return_value.mod.remove.side_effect = None
+    remove.next_attempt = datetime.now() - timedelta(seconds=2)
+    reply.next_attempt = datetime.now() - timedelta(seconds=1)
+    assert drain(wd) == {"done": 1, "waiting": 1}
+    assert remove.action_status_enum == ActionStatus.DONE
+    reply.next_attempt = datetime.now() - timedelta(seconds=1)
+    assert drain(wd) == {"done": 1}
+    wd.ri.reddit_client.submission.return_value.reply.assert_called_once()
+
+
+def test_reply_fails_with_its_removal():
+    wd = make_wd()
+    remove = queue(wd, "remove", "abc123", post_id="abc123")
+    reply = queue(wd, "reply", "abc123", post_id="abc123", body="reply")
+    remove.action_status_enum = ActionStatus.FAILED
+    on_failed = mock.Mock()
+    assert drain(wd, on_failed=on_failed) == {"failed": 1}
+    assert reply.action_status_enum == ActionStatus.FAILED
+    on_failed.assert_called_once()
+    wd.ri.reddit_client.submission.return_value.reply.assert_not_called()
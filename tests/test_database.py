@@ -0,0 +1,22 @@
+from sqlalchemy import Boolean, Column, Integer, String, Table, inspect, text
+
+from database import Database
+
+
+def test_missing_columns_keep_their_nullability_and_default():
+    db = Database()
+    db.engine.execute("CREATE TABLE widgets (id INTEGER PRIMARY KEY)")
+    db.engine.execute("INSERT INTO widgets (id) VALUES (1)")
+    Table("widgets", db.Base.metadata, Column("id", Integer, primary_key=True),
+          Column("error_count", Integer, nullable=False, default=0),
+          Column("enabled", Boolean, nullable=False, server_default=text("1")),
+          Column("label", String(20), nullable=False, default="none"),
+          Column("note", String(20), nullable=True))
+
+    assert sorted(db.migrate_columns()) == ["widgets.enabled", "widgets.error_count", "widgets.label",
+                                            "widgets.note"]
+    columns = {column["name"]: column for column in inspect(db.engine).get_columns("widgets")}
+    assert not columns["error_count"]["nullable"] and not columns["label"]["nullable"]
+    assert columns["note"]["nullable"]
+    assert list(db.engine.execute("SELECT error_count, enabled, label, note FROM widgets")) == [(0, 1, "none", None)]
+    assert db.migrate_columns() == []
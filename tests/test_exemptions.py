@@ -0,0 +1,72 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+import pytz
+
+from enums import CountedStatus, PostedStatus
+from utils import check_for_post_exemptions
+
+
+class FakeRedditInterface:
+    def __init__(self, posted_status):
+        self.posted_status = posted_status
+        self.calls = 0
+
+    def get_posted_status(self, post, get_removed_info=False):
+        self.calls += 1
+        return self.posted_status
+
+
+class FakeSession:
+    def add(self, obj):
+        pass
+
+    def commit(self):
+        pass
+
+
+def make_post(posted_status, last_checked):
+    return SimpleNamespace(id="abc123", counted_status_enum=CountedStatus.NOT_CHKD, posted_status=posted_status,
+                           last_checked=last_checked, is_oc=True, is_self=False)
+
+
+def make_sub():
+    return SimpleNamespace(ignore_AutoModerator_removed=True, ignore_moderator_removed=True, exempt_oc=True,
+                           exempt_self_posts=False, exempt_link_posts=False)
+
+
+def make_wd(api_status):
+    return SimpleNamespace(ri=FakeRedditInterface(api_status), s=FakeSession(), exemption_stats=Counter())
+
+
+@pytest.mark.parametrize("posted_status, expected", [
+    (PostedStatus.SPAM_FLT, CountedStatus.SPAMMED_EXMPT),
+    (PostedStatus.AUTOMOD_RM, CountedStatus.AM_RM_EXEMPT),
+    (PostedStatus.FH_RM, CountedStatus.FLAIR_HELPER),
+    (PostedStatus.MOD_RM, CountedStatus.MOD_RM_EXEMPT),
+    (PostedStatus.UP, CountedStatus.OC_EXEMPT),
+])
+def test_fresh_stored_status_decides_locally(posted_status, expected):
+    wd = make_wd(PostedStatus.UNKNOWN)
+    post = make_post(posted_status.value, datetime.now(pytz.utc) - timedelta(minutes=5))
+    assert check_for_post_exemptions(make_sub(), post, wd=wd)[0] == expected
+    assert wd.ri.calls == 0
+    assert wd.exemption_stats == Counter(local=1)
+
+
+@pytest.mark.parametrize("posted_status, expected", [
+    (PostedStatus.SPAM_FLT, CountedStatus.SPAMMED_EXMPT),
+    (PostedStatus.AUTOMOD_RM, CountedStatus.AM_RM_EXEMPT),
+    (PostedStatus.FH_RM, CountedStatus.FLAIR_HELPER),
+    (PostedStatus.MOD_RM, CountedStatus.MOD_RM_EXEMPT),
+    (PostedStatus.UP, CountedStatus.OC_EXEMPT),
+])
+def test_stale_status_asks_reddit(posted_status, expected):
+    wd = make_wd(posted_status)
+    post = make_post(PostedStatus.UP.value, datetime.now(pytz.utc) - timedelta(days=1))
+    assert check_for_post_exemptions(make_sub(), post, wd=wd)[0] == expected
+    assert wd.ri.calls == 1
+    assert wd.exemption_stats == Counter(api=1)
+    assert post.posted_status == posted_status.value
@@ -0,0 +1,23 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from enums import CountedStatus
+from frequency_engine import FrequencyEngine
+
+
+def make_post(post_id, minutes_ago):
+    return SimpleNamespace(id=post_id, author="someone", subreddit_name="testsub",
+                           counted_status_enum=CountedStatus.NOT_CHKD,
+                           time_utc=datetime(2026, 1, 1, 12, 0) - timedelta(minutes=minutes_ago))
+
+
+def test_candidate_posts_are_in_time_order():
+    tr_sub = SimpleNamespace(min_post_interval=timedelta(hours=24), grace_period=timedelta(0),
+                             max_count_per_interval=1)
+    engine = FrequencyEngine()
+    # ids that sort the other way round as strings, and one arriving out of order
+    for post_id, minutes_ago in (("zzz111", 60), ("aaa222", 30), ("mmm333", 45)):
+        engine.add_post(tr_sub, make_post(post_id, minutes_ago))
+    candidate, = engine.pop_candidates()
+    assert candidate.posts == ["zzz111", "mmm333", "aaa222"]
+    assert candidate.latest_post_id == "aaa222"
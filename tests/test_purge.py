@@ -0,0 +1,49 @@
+from unittest import mock
+
+import pytest
+
+from models.reddit_models import Task
+from purge import PURGE_SELECT, ChunkedPurge
+
+
+class FakeSession:
+    def __init__(self, post_ids, state, crash_after_commits=None):
+        self.post_ids = post_ids
+        self.state = state
+        self.deleted = []
+        self.committed = []
+        self.crash_after_commits = crash_after_commits
+
+    def query(self, model):
+        return mock.Mock(get=lambda key: self.state)
+
+    def execute(self, statement, params):
+        if len(self.committed) == self.crash_after_commits:
+            raise RuntimeError("restarted")
+        if statement == PURGE_SELECT:
+            after = [post_id for post_id in self.post_ids if post_id > params["checkpoint"]]
+            return [(post_id,) for post_id in after[:params["batch_size"]]]
+        self.deleted.extend(params["post_ids"])
+        self.post_ids = [post_id for post_id in self.post_ids if post_id not in params["post_ids"]]
+
+    def commit(self):
+        self.committed.append((self.state.checkpoint, self.state.next_pass))
+
+
+@mock.patch("purge.PURGE_BATCH_SLEEP_SECS", 0)
+@mock.patch("purge.PURGE_BATCH_SIZE", 2)
+def test_restart_resumes_from_the_stored_checkpoint():
+    state = Task("purge_old_records", 60)
+    wd = mock.Mock(s=FakeSession(["a", "b", "c", "d", "e"], state, crash_after_commits=1))
+    with pytest.raises(RuntimeError):
+        ChunkedPurge().run_tick(wd)
+    assert wd.s.deleted == ["a", "b"] and state.checkpoint == "b"
+    assert wd.s.committed == [("b", None)]  # with the batch, not after it
+
+    wd.s.crash_after_commits = None
+    ChunkedPurge().run_tick(wd)  # after a restart: nothing but the aa_tasks row carried over
+    assert wd.s.deleted == ["a", "b", "c", "d", "e"]
+    assert state.checkpoint is None and state.next_pass
+
+    ChunkedPurge().run_tick(wd)  # the next pass waits, across restarts too
+    assert wd.s.deleted == ["a", "b", "c", "d", "e"]
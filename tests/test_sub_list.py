@@ -0,0 +1,73 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+from enums import SubStatus
+from main import update_sub_list
+from models.reddit_models import TrackedSubreddit
+
+CONFIG = """
+post_restriction:
+    max_count_per_interval: {count}
+    min_post_interval_hrs: 24
+    ban_duration_days: ~
+"""
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def populate_existing(self):
+        return self
+
+    def filter(self, *criteria):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def query(self, model):
+        return FakeQuery(self.rows)
+
+    def add(self, obj):
+        pass
+
+    def commit(self):
+        pass
+
+
+def make_sub(count, revision):
+    sub_info = SimpleNamespace(active_status_enum=SubStatus.ACTIVE, mod_list="",
+                               settings_yaml_txt=CONFIG.format(count=count), settings_revision_date=revision, settings_wiki_page="testbot", settings_yaml=None,
+                               bot_mod=None, is_nsfw=False)
+    tr = TrackedSubreddit("testsub", sub_info=sub_info)
+    tr.mod_list = None
+    return tr
+
+
+def test_lane_reloads_a_config_stored_by_another_lane():
+    tr = make_sub(1, 100)
+    wd = SimpleNamespace(s=FakeSession([tr]), sub_dict={}, ri=SimpleNamespace(bot_name="testbot"))
+    update_sub_list(wd, refresh_configs=False)
+    assert wd.sub_dict["testsub"].max_count_per_interval == 1
+
+    # what populate_existing leaves on this lane's copy after the bulk lane stored a new revision
+    tr.settings_yaml_txt, tr.settings_revision_date = CONFIG.format(count=3), 200
+    tr.settings_json = tr.settings_yaml_hash = None
+    update_sub_list(wd, refresh_configs=False)
+    assert wd.sub_dict["testsub"].max_count_per_interval == 3
+    assert wd.sub_dict["testsub"].min_post_interval == timedelta(hours=24)
+
+
+def test_lane_drops_a_sub_whose_config_broke():
+    tr = make_sub(1, 100)
+    wd = SimpleNamespace(s=FakeSession([tr]), sub_dict={}, ri=SimpleNamespace(bot_name="testbot"))
+    update_sub_list(wd, refresh_configs=False)
+    tr.settings_yaml_txt, tr.settings_revision_date = "post_restriction: [", 200
+    update_sub_list(wd, refresh_configs=False)
+    assert "testsub" not in wd.sub_dict
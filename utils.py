@@ -3,33 +3,115 @@ from __future__ import annotations
 from static import *
 import logging
 from datetime import datetime, timedelta
-from typing import List
+from typing import Dict, List
 import humanize
 import iso8601
 import praw
 import prawcore
 import pytz
+import random
 import re
 
 from sqlalchemy import *
 from sqlalchemy.ext.declarative import declarative_base
 from praw.models.listing.generator import ListingGenerator
 import queue
-from models.reddit_models import SubAuthor, SubmittedPost, \
+from models.reddit_models import LoggedAction, SubAuthor, SubmissionRecord, SubmittedPost, \
     TrackedAuthor, TrackedSubreddit, RedditInterface, PostingGroup
 from logger import logger
 from sqlalchemy import exc
 from settings import MAIN_BOT_NAME
 from nsfw_monitoring import check_post_nsfw_eligibility
+from frequency_engine import FrequencyEngine
+from actionqueue import drain_action_queue, enqueue_action
+from partitioning import archived_violations
 
 
 
+def get_known_post_ids(wd: WorkingData, post_ids: List[str], chunk_size=KNOWN_ID_CHUNK_SIZE) -> set:
+    # one IN (...) query per chunk instead of one SELECT per post
+    known_ids = set()
+    for j in range(0, len(post_ids), chunk_size):
+        rs = wd.s.query(SubmittedPost.id).filter(SubmittedPost.id.in_(post_ids[j:j + chunk_size])).all()
+        known_ids.update(row[0] for row in rs)
+    return known_ids
+
+
+def load_posts_by_id(wd: WorkingData, post_ids, chunk_size=KNOWN_ID_CHUNK_SIZE) -> Dict[str, SubmittedPost]:
+    # bulk version of wd.s.query(SubmittedPost).get(post_id) - one IN (...) query per chunk
+    post_ids = list(dict.fromkeys(post_ids))
+    posts_by_id = {}
+    for j in range(0, len(post_ids), chunk_size):
+        for post in wd.s.query(SubmittedPost).filter(SubmittedPost.id.in_(post_ids[j:j + chunk_size])):
+            posts_by_id[post.id] = post
+    return posts_by_id
+
+
 def check_new_submissions(wd: WorkingData, query_limit=800, sub_list='mod', intensity=0):
-    subreddit_names = []
-    subreddit_names_complete = []
+    possible_new_posts, subreddit_names_complete = fetch_new_submissions(wd, query_limit=query_limit,
+                                                                         sub_list=sub_list, intensity=intensity)
+    ingest_new_submissions(wd, possible_new_posts, subreddit_names_complete, intensity=intensity, sub_list=sub_list)
+
+
+def fetch_new_submissions(wd: WorkingData, query_limit=800, sub_list='mod', intensity=0):
+    # Reddit API only - safe to run from a worker thread
+    subreddit_names_complete = set()
+    chunk_sub_names = set(sub_list.lower().split('+')) if sub_list != 'mod' else set()
     logger.info(f"main/CNW: pulling new posts!  intensity: {intensity}")
 
-    possible_new_posts = [a for a in wd.ri.reddit_client.subreddit(sub_list).new(limit=query_limit)]
+    # Listing is newest first, so paging can stop where the last ingested scan of this listing started - the
+    # newest post it saw. Before there is one (boot), stop once older than every sub's cursor
+    listing_mark = wd.listing_marks.get(sub_list)
+    if listing_mark:
+        stop_before = listing_mark - timedelta(minutes=NEW_LISTING_OVERLAP_MINS)
+    else:
+        chunk_cursors = [wd.sub_dict[a].newest_post_utc if a in wd.sub_dict else None for a in chunk_sub_names]
+        stop_before = min(chunk_cursors) if chunk_cursors and all(chunk_cursors) else None
+
+    # Pulled lazily, so a scan only pages back to stop_before; subs past their cursor are skipped without a db lookup
+    possible_new_posts = []
+    for post_to_review in wd.ri.reddit_client.subreddit(sub_list).new(limit=query_limit):
+        subreddit_name = str(post_to_review.subreddit).lower()
+        created_utc = datetime.utcfromtimestamp(post_to_review.created_utc)
+        if intensity == 0 and stop_before and created_utc < stop_before:
+            break
+        if intensity == 0 and subreddit_name in subreddit_names_complete:
+            continue
+        tr_sub: TrackedSubreddit = wd.sub_dict.get(subreddit_name)
+        if intensity == 0 and tr_sub and tr_sub.has_passed_cursor(post_to_review.id, created_utc):
+            subreddit_names_complete.add(subreddit_name)
+            if chunk_sub_names and chunk_sub_names <= subreddit_names_complete:
+                break
+            continue
+        possible_new_posts.append(post_to_review)
+    return possible_new_posts, subreddit_names_complete
+
+
+def bulk_insert_posts(wd: WorkingData, records: List[SubmissionRecord]):
+    # one executemany, no ORM objects; IGNORE so a post another lane/process just saved doesn't fail the batch
+    if not records:
+        return
+    insert_statement = SubmittedPost.__table__.insert() \
+        .prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+    wd.s.execute(insert_statement, [record.to_row() for record in records])
+
+
+def persist_new_posts(wd: WorkingData, records: List[SubmissionRecord]):
+    # the only step that touches the db; records also go to the frequency engine here
+    if BULK_INGEST:
+        bulk_insert_posts(wd, records)
+    else:
+        wd.s.add_all([SubmittedPost(record) for record in records])
+    if wd.frequency_engine:
+        for record in records:
+            if record.subreddit_name in wd.sub_dict:
+                wd.frequency_engine.add_post(wd.sub_dict[record.subreddit_name], record)
+
+
+def ingest_new_submissions(wd: WorkingData, possible_new_posts, subreddit_names_complete, intensity=0, sub_list=None):
+    # resolve which of these we already have in one go
+    known_ids = get_known_post_ids(wd, [a.id for a in possible_new_posts])
+    new_records = []
 
     count = 0
     total = 0
@@ -42,75 +124,120 @@ def check_new_submissions(wd: WorkingData, query_limit=800, sub_list='mod', inte
             # print(f'done w/ {subreddit_name} @ {total}')
             continue
 
+        record = SubmissionRecord.from_submission(post_to_review)
+        tr_sub: TrackedSubreddit = wd.sub_dict.get(subreddit_name)
+        if tr_sub:
+            tr_sub.advance_cursor(record.id, record.time_utc)
+
         # check if we know this post
-        previous_post: SubmittedPost = wd.s.query(SubmittedPost).get(post_to_review.id)
-        if previous_post:  # seen this post before -> ignore posts from this  sub
-            subreddit_names_complete.append(subreddit_name)
+        if record.id in known_ids:  # seen this post before -> ignore posts from this  sub
+            subreddit_names_complete.add(subreddit_name)
             # logger.info(f"seen this post before {subreddit_name} {post_to_review.id}")
             continue
-        if not previous_post:  # have not seen this post, add to db
-            post = SubmittedPost(post_to_review)
-            if post.subreddit_name in wd.nsfw_monitoring_subs:   # do nsfw eligibility check if applicable
-                check_post_nsfw_eligibility(wd, post)
-
+        # have not seen this post, add to db
+        known_ids.add(record.id)
+        count += 1
+        if subreddit_name in wd.nsfw_monitoring_subs:   # do nsfw eligibility check if applicable
+            post = SubmittedPost(record)
+            post.api_handle = post_to_review
+            check_post_nsfw_eligibility(wd, post)
             wd.s.add(post)
-            count += 1
+            if wd.frequency_engine and tr_sub:
+                wd.frequency_engine.add_post(tr_sub, record)
+            continue
+        new_records.append(record)
+    persist_new_posts(wd, new_records)
     logger.info(f'main/CNW: found {count} posts out of {total}')
     wd.s.commit()
+    if sub_list and possible_new_posts:  # only once committed, so a failed scan is repeated in full
+        newest_utc = datetime.utcfromtimestamp(max(post.created_utc for post in possible_new_posts))
+        wd.listing_marks[sub_list] = max(newest_utc, wd.listing_marks.get(sub_list, newest_utc))
 
 
 def check_spam_submissions(wd: WorkingData, sub_list='mod', intensity=0):
+    possible_spam_posts = fetch_spam_submissions(wd, sub_list=sub_list)
+    ingest_spam_submissions(wd, possible_spam_posts, intensity=intensity)
+
+
+def fetch_spam_submissions(wd: WorkingData, sub_list='mod'):
+    # Reddit API only - safe to run from a worker thread
     possible_spam_posts = []
     try:
         possible_spam_posts = [a for a in wd.ri.reddit_client.subreddit(sub_list).mod.spam(only='submissions')]
     except prawcore.exceptions.Forbidden:
         pass
+    return possible_spam_posts
+
+
+def ingest_spam_submissions(wd: WorkingData, possible_spam_posts, intensity=0):
+    new_records = []
     for post_to_review in possible_spam_posts:
         previous_post: SubmittedPost = wd.s.query(SubmittedPost).get(post_to_review.id)
         if previous_post and intensity == 0:
             break
         if not previous_post:
-            post = SubmittedPost(post_to_review)
+            post = SubmissionRecord.from_submission(post_to_review)
             if post.banned_by is True:
-                post.posted_status = PostedStatus.AUTOMOD_RM
+                post.posted_status = PostedStatus.AUTOMOD_RM.value
             elif post.banned_by == "AutoModerator":
                 post.posted_status = PostedStatus.SPAM_FLT.value
             post.reviewed = True
-            sub_list = post.subreddit_name.lower()
+            sub_list = post.subreddit_name
             # logger.info("found spam post: '{0}...' http://redd.it/{1} ({2})".format(post.title[0:20], post.id,
             #                                                                         subreddit_name))
 
             # post.reviewed = True
-            wd.s.add(post)
+            new_records.append(post)
             subreddit_author: SubAuthor = wd.s.query(SubAuthor).get((sub_list, post.author))
             if subreddit_author and subreddit_author.hall_pass >= 1:
                 subreddit_author.hall_pass -= 1
-                post.api_handle.mod.approve()
+                wd.ri.reddit_client.submission(id=post.id).mod.approve()  # listing came from a fetch worker
+                wd.ri.invalidate_posted_status(post.id)
                 wd.s.add(subreddit_author)
+    persist_new_posts(wd, new_records)
     wd.s.commit()
 
 
+EXEMPTION_CHECKED_STATUSES = (CountedStatus.NEEDS_UPDATE, CountedStatus.NOT_CHKD, CountedStatus.PREV_EXEMPT,
+                              CountedStatus.COUNTS, CountedStatus.REVIEWED)
+
+
+def exemption_inputs_stale(recent_post: SubmittedPost) -> bool:
+    # posted status and flairs are refreshed together, so one timestamp says whether either can be trusted
+    if recent_post.posted_status == PostedStatus.UNKNOWN.value or not recent_post.last_checked:
+        return True
+    last_checked = recent_post.last_checked.replace(tzinfo=None)
+    return last_checked < datetime.now(pytz.utc).replace(tzinfo=None) - timedelta(minutes=EXEMPTION_INPUT_MAX_AGE_MINS)
+
+
+def prefetch_exemption_inputs(wd, posts: List[SubmittedPost]) -> int:
+    # one /api/info batch for the posts check_for_post_exemptions can't decide from stored columns
+    to_fetch = [post for post in posts if isinstance(post, SubmittedPost)
+                and post.counted_status_enum in EXEMPTION_CHECKED_STATUSES and exemption_inputs_stale(post)]
+    if to_fetch:
+        wd.ri.get_posted_statuses(to_fetch, get_removed_info=True)
+    return len(to_fetch)
+
+
 def check_for_post_exemptions(tr_sub: TrackedSubreddit, recent_post: SubmittedPost, wd=None):  # uses some reddit api
     # check if removed
-    if recent_post.counted_status_enum not in (CountedStatus.NEEDS_UPDATE, CountedStatus.NOT_CHKD, CountedStatus.PREV_EXEMPT, CountedStatus.COUNTS, CountedStatus.REVIEWED):
+    if recent_post.counted_status_enum not in EXEMPTION_CHECKED_STATUSES:
         return CountedStatus(recent_post.counted_status_enum),\
                f"previously exempted {CountedStatus(recent_post.counted_status_enum)}"
 
-    posted_status = recent_post.posted_status
-    if posted_status == PostedStatus.UNKNOWN.value \
-            or (recent_post.last_checked
-                and recent_post.last_checked < datetime.now(pytz.utc).replace(tzinfo=None) - timedelta(hours=3)):
+    if exemption_inputs_stale(recent_post):
+        # normally served from the prefetch_exemption_inputs batch; also refreshes post_flair/author_flair
         posted_status = wd.ri.get_posted_status(recent_post, get_removed_info=True)  # uses some reddit api
         recent_post.posted_status = posted_status.value
-        recent_post.post_flair = recent_post.api_handle.link_flair_text
-        recent_post.author_flair = recent_post.api_handle.author_flair_text
-        # recent_post.author_css = recent_post.api_handle.author_css_text
         recent_post.last_checked = datetime.now(pytz.utc)
+        wd.exemption_stats["api"] += 1
 
         wd.s.add(recent_post)
         wd.s.commit()
     else:
+        posted_status = PostedStatus(recent_post.posted_status)  # stored as the value, compared as the enum below
         print(f"recently updated, assuming no change to posted status {posted_status}")
+        wd.exemption_stats["local"] += 1
     # banned_by = recent_post.get_api_handle().banned_by
     # logger.debug(">>>>exemption status: {}".format(banned_by))
 
@@ -129,57 +256,37 @@ def check_for_post_exemptions(tr_sub: TrackedSubreddit, recent_post: SubmittedPo
         return CountedStatus.SELF_EXEMPT, ""
     elif tr_sub.exempt_link_posts and recent_post.is_self is not True:  # won't change
         return CountedStatus.LINK_EXEMPT, ""
-    if tr_sub.exempt_moderator_posts and recent_post.author in tr_sub.subreddit_mods: # may change
+    matcher = tr_sub.get_exemption_matcher()
+    if tr_sub.exempt_moderator_posts and matcher.is_mod(recent_post.author):  # may change
         return CountedStatus.MODPOST_EXEMPT, "moderator exempt"
-    # check if flair-exempt
-    try:
-        author_flair = wd.ri.get_submission_api_handle(recent_post).author_flair_text  # Reddit API
-        author_css = None
-        #author_css = wd.ri.get_submission_api_handle(recent_post).auth  # Reddit API
-    except prawcore.exceptions.Forbidden:
-        print("can't access flair")
-        author_flair = None
+    # check if flair-exempt - stored flairs are at most EXEMPTION_INPUT_MAX_AGE_MINS old here
+    author_flair = recent_post.author_flair if matcher.needs_author_flair else None
     # add CSS class to author_flair
     #if author_flair and wd.ri.get_submission_api_handle(recent_post).author_flair_css_class:  # Reddit API
     #     author_flair = author_flair + wd.ri.get_submission_api_handle(recent_post).author_flair_css_class  # Reddit API
 
     # Flair keyword exempt
-    if tr_sub.author_exempt_flair_keyword and isinstance(tr_sub.author_exempt_flair_keyword, str) \
-            and ((author_flair and tr_sub.author_exempt_flair_keyword in author_flair)
-            or (author_css and tr_sub.author_not_exempt_flair_keyword in author_css)):
+    if matcher.author_exempt_flair.first_match(author_flair):
         logger.debug(">>>flair exempt")
         return CountedStatus.FLAIR_EXEMPT, "flair exempt {}".format(author_flair)
 
     # Not-flair-exempt keyword (Only restrict certain flairs)
-    if tr_sub.author_not_exempt_flair_keyword \
-            and ((author_flair and tr_sub.author_not_exempt_flair_keyword not in author_flair) or not author_flair):
+    if matcher.author_not_exempt_flair and not matcher.author_not_exempt_flair.first_match(author_flair):
         return CountedStatus.FLAIR_NOT_EXEMPT, "flair not exempt {}".format(author_flair)
 
     # check if title keyword exempt:
-    if tr_sub.title_exempt_keyword:
-        flex_title = recent_post.title.lower()
-        if (isinstance(tr_sub.title_exempt_keyword, str)
-            and tr_sub.title_exempt_keyword.lower() in flex_title) or \
-                (isinstance(tr_sub.title_exempt_keyword, list)
-                 and any(x in flex_title for x in [y.lower() for y in tr_sub.title_exempt_keyword])):
-            logger.debug(">>>title keyword exempted")
-            return CountedStatus.TITLE_KW_EXEMPT, f"title keyword exempt {tr_sub.title_exempt_keyword} -> exemption"
+    keyword = matcher.title_exempt.first_match(recent_post.title)
+    if keyword:
+        logger.debug(">>>title keyword exempted")
+        return CountedStatus.TITLE_KW_EXEMPT, f"title keyword exempt {keyword} -> exemption"
 
     # title keywords only to restrict:
-    if tr_sub.title_not_exempt_keyword:
-        link_flair = wd.ri.get_submission_api_handle(recent_post).link_flair_text  # Reddit API
-        if link_flair:
-            flex_title = recent_post.title.lower() + link_flair
-        else:
-            flex_title = recent_post.title.lower()
-        print(flex_title)
+    if matcher.needs_link_flair:
+        link_flair = recent_post.post_flair
         # example: restriction "Selfies"
         # if there is a restriction and required keyword is not in title -> does not meet restriction criteria, exempt
-        if (isinstance(tr_sub.title_not_exempt_keyword, str)
-            and tr_sub.title_not_exempt_keyword.lower() not in flex_title) or \
-                (isinstance(tr_sub.title_not_exempt_keyword, list)
-                 and all(x not in flex_title for x in [y.lower() for y in tr_sub.title_not_exempt_keyword])):
-            logger.debug(f">>>meets restriction criteria: {flex_title}, restriction: {tr_sub.title_not_exempt_keyword}")
+        if not matcher.title_restriction_met(recent_post.title, link_flair):
+            logger.debug(f">>>meets restriction criteria: {recent_post.title}, restriction: {tr_sub.title_not_exempt_keyword}")
             return CountedStatus.TITLE_CRITERIA_NOT_MET, f"title does not have {tr_sub.title_not_exempt_keyword} -> exemption"
     return CountedStatus.COUNTS, "no exemptions"
 
@@ -369,9 +476,19 @@ def do_reddit_actions(wd):
     to_update = wd.s.query(SubmittedPost)\
         .filter(SubmittedPost.counted_status_enum == CountedStatus.NEEDS_UPDATE)\
         .filter(SubmittedPost.time_utc > datetime.now(pytz.utc).replace(tzinfo=None) - timedelta(hours=48))
-    for op in to_update:
+    to_update = to_update.all()
+    if wd.ari:
+        statuses = wd.ari.gather(*(wd.ari.get_posted_status(op, refresh=True) for op in to_update))
+    else:
+        statuses = wd.ri.get_posted_statuses(to_update, refresh=True)
+        statuses = [statuses[op.id] for op in to_update]
+    for j, op in enumerate(to_update):
         assert(isinstance(op, SubmittedPost))
-        op.posted_status = wd.ri.get_posted_status(op).value
+        posted_status = statuses[j]
+        if isinstance(posted_status, Exception):
+            logger.warning(f"could not get status for {op.id}: {posted_status}")
+            continue
+        op.posted_status = posted_status.value
         op.last_checked = datetime.now(pytz.utc)
         wd.s.add(op)
     wd.s.commit()
@@ -383,31 +500,81 @@ def do_reddit_actions(wd):
         .filter(SubmittedPost.time_utc > datetime.now(pytz.utc).replace(tzinfo=None) - timedelta(hours=24))
     # print(f"blacklist removals {to_remove.rowcount}")
     for op in to_remove:
-        # logger.info(f'removing post {op.author} {op.title} {op.subreddit_name}')
+        # the post keeps its NEED_REMOVE status until the removal is done - queueing it again is a no-op
         tr_sub = get_subreddit_by_name(wd, op.subreddit_name)
-        try:
-            wd.ri.get_submission_api_handle(op).mod.remove()
-            logger.info(f'remove successful!: {op.subreddit_name} {op.author} {op.title}')
-            new_counted_status = CountedStatus.REMOVED \
-                if op.counted_status_enum == CountedStatus.NEED_REMOVE else CountedStatus.BLKLIST
-            if op.reply_comment:
-                wd.ri.reply(op, op.reply_comment, distinguish=tr_sub.distinguish, approve=tr_sub.approve,
-                            lock_thread=tr_sub.lock_thread)
-            op.counted_status_enum = new_counted_status
-            op.reply_comment = None
-        except prawcore.exceptions.Forbidden as e:
-            logger.warning(f'No permission to remove post {op.author} {op.title} {op.subreddit_name} {str(e)}')
-            op.counted_status_enum = CountedStatus.REMOVE_FAILED
-            wd.sub_dict[op.subreddit_name].active_status_enum = SubStatus.NO_REMOVE_ACCESS
-            wd.s.add(wd.sub_dict[op.subreddit_name])
-            print('test')
-        except (praw.exceptions.APIException,  prawcore.exceptions.ServerError) as e:
-            logger.warning(f'something went wrong in removing post {op.author} {op.title} {op.subreddit_name} {str(e)}')
-            op.counted_status_enum = CountedStatus.REMOVE_FAILED
+        enqueue_action(wd, "remove", op.id, op.subreddit_name, post_id=op.id,
+                       blacklist=op.counted_status_enum == CountedStatus.BLKLIST_NEED_REMOVE,
+                       distinguish=tr_sub.distinguish if tr_sub else False,
+                       approve=tr_sub.approve if tr_sub else False,
+                       lock_thread=tr_sub.lock_thread if tr_sub else True)
+    wd.s.commit()
 
+    drain_action_queue(wd, on_action_done, on_action_failed)
 
+
+def queue_modmail(wd, tr_sub: TrackedSubreddit, action_id: str, subject: str, body: str, use_same_thread=False):
+    enqueue_action(wd, "modmail", action_id, tr_sub.subreddit_name, subreddit_name=tr_sub.subreddit_name,
+                   subject=subject, body=body, use_same_thread=use_same_thread,
+                   thread_id=tr_sub.mm_convo_id if use_same_thread else None)
+
+
+def on_action_done(wd, logged_action: LoggedAction, payload: dict, result: dict):
+    # called by drain_action_queue on this thread once an action has gone through
+    if logged_action.action_type == "remove":
+        wd.ri.invalidate_posted_status(payload["post_id"])
+        op = wd.s.query(SubmittedPost).get(payload["post_id"])
+        if not op:
+            return
+        logger.info(f'remove successful!: {op.subreddit_name} {op.author} {op.title}')
+        if op.reply_comment:
+            enqueue_action(wd, "reply", op.id, op.subreddit_name, post_id=op.id, body=op.reply_comment,
+                           distinguish=payload["distinguish"], approve=payload["approve"],
+                           lock_thread=payload["lock_thread"])
+        op.counted_status_enum = CountedStatus.BLKLIST if payload["blacklist"] else CountedStatus.REMOVED
+        op.reply_comment = None
         wd.s.add(op)
-    wd.s.commit()
+    elif logged_action.action_type == "reply":
+        op = wd.s.query(SubmittedPost).get(payload["post_id"])
+        if op and not op.bot_comment_id:
+            op.bot_comment_id = result.get("comment_id")
+            wd.s.add(op)
+    elif logged_action.action_type == "modmail" and payload.get("use_same_thread") and result.get("conversation_id"):
+        tr_sub = get_subreddit_by_name(wd, logged_action.subreddit_name, update_if_due=False)
+        if tr_sub:
+            tr_sub.mm_convo_id = result["conversation_id"]
+            wd.s.add(tr_sub)
+    elif logged_action.action_type == "ban":
+        logger.info(f"Ban for {payload['author']} on r/{logged_action.subreddit_name} succeeded "
+                    f"{'(already banned) ' if result.get('already_banned') else ''}"
+                    f"for {payload['duration'] or 'PERMANENT'} days")
+
+
+def on_action_failed(wd, logged_action: LoggedAction, payload: dict, error: Exception):
+    # called by drain_action_queue once an action has been given up on
+    forbidden = isinstance(error, prawcore.exceptions.Forbidden)
+    if logged_action.action_type == "remove":
+        op = wd.s.query(SubmittedPost).get(payload["post_id"])
+        if op:
+            logger.warning(f'could not remove post {op.author} {op.title} {op.subreddit_name} {str(error)}')
+            op.counted_status_enum = CountedStatus.REMOVE_FAILED
+            wd.s.add(op)
+        tr_sub = get_subreddit_by_name(wd, logged_action.subreddit_name, update_if_due=False)
+        if forbidden and tr_sub:
+            tr_sub.active_status_enum = SubStatus.NO_REMOVE_ACCESS
+            wd.s.add(tr_sub)
+    elif logged_action.action_type == "ban" and forbidden:
+        logger.info("Ban failed - no access?")
+        tr_sub = get_subreddit_by_name(wd, logged_action.subreddit_name, update_if_due=False)
+        recent_post = wd.s.query(SubmittedPost).get(payload["post_id"])
+        if not tr_sub:
+            return
+        tr_sub.ban_ability = -2
+        wd.s.add(tr_sub)
+        if payload.get("notify_body"):
+            queue_modmail(wd, tr_sub, f"{payload['post_id']}-spammer",
+                          "[Notification] Multiple post frequency violations", payload["notify_body"])
+        if recent_post:
+            soft_blacklist(tr_sub, recent_post, iso8601.parse_date(payload["blacklist_until"]), wd=wd)
 
 def look_for_rule_violations4(wd):
     # automated_reviews(wd)
@@ -520,20 +687,17 @@ def look_for_rule_violations3(wd):
                 TrackedSubreddit.active_status_enum.in_((SubStatus.ACTIVE,SubStatus.NO_BAN_ACCESS))
                 ).order_by(SubmittedPost.added_time.desc()).all()
 
+    # groups are collected as id lists first and hydrated together below
+    leftover_groups = []
     for post in posts_to_verify:
         if not most_recent_identified:
             most_recent_identified = post
         assert isinstance(post, SubmittedPost)
         post_ids = post.review_debug.replace("ma:", "").split(',')
+        leftover_groups.append((post, post_ids))
+    logger.debug(f"# of leftover posts from before: {len(leftover_groups)}")
 
-        posts = []
-        for post_id in post_ids:
-            posts.append(wd.s.query(SubmittedPost).get(post_id))
-        posting_groups.append(
-            PostingGroup(post.id, author_name=post.author, subreddit_name=post.subreddit_name, posts=posts))
-    logger.debug(f"# of leftover posts from before: {len(posting_groups)}")
-
-    logger.debug(f"leftover posts from before: {len(posting_groups)}")
+    logger.debug(f"leftover posts from before: {len(leftover_groups)}")
 
     if not most_recent_identified:
         most_recent_identified: SubmittedPost | None = wd.s.query(SubmittedPost) \
@@ -579,16 +743,38 @@ def look_for_rule_violations3(wd):
         if most_recent_identified and most_recent_identified.added_time else "2022-06-30 00:00:00"
     logger.debug(f"doing more accurate {datetime.now()} last date:{last_date}")
     # last_date = "2022-06-30 00:00:00"  # REMOVE THIS!!!!!!!!!!!!!!!!!!!!!!!
-    rs = wd.s.execute(more_accurate_statement, {"look_back": last_date})
-    logger.debug(f"query took this long {datetime.now() - tick}")
+    engine = wd.frequency_engine
+    if engine and not engine.warmed:
+        engine.warm_start(wd)
+    if engine and FREQUENCY_ENGINE_MODE == "on":
+        # candidates come from the in-memory windows, no GROUP BY needed
+        rows = [(pg.latest_post_id, ",".join(pg.posts), "", pg.author_name, pg.subreddit_name, "")
+                for pg in engine.pop_candidates()]
+    else:
+        rs = wd.s.execute(more_accurate_statement, {"look_back": last_date})
+        logger.debug(f"query took this long {datetime.now() - tick}")
+        rows = rs.fetchall()
+        if engine and FREQUENCY_ENGINE_MODE == "shadow":
+            engine.compare_with_sql([(row[4].lower(), row[3]) for row in rows],
+                                    [(pg.subreddit_name, pg.author_name) for pg in engine.pop_candidates()])
+
+    # hydrate every group's posts in one go instead of a get() per id
+    tick = datetime.now()
+    all_post_ids = [post_id for _, post_ids in leftover_groups for post_id in post_ids]
+    all_post_ids += [post_id for row in rows for post_id in row[1].replace("ma:", "").split(',')]
+    posts_by_id = load_posts_by_id(wd, all_post_ids)
+    logger.debug(f"loaded {len(posts_by_id)} posts for {len(leftover_groups) + len(rows)} groups "
+                 f"in {datetime.now() - tick}")
+
+    for post, post_ids in leftover_groups:
+        posts = [posts_by_id.get(post_id) for post_id in post_ids]
+        posting_groups.append(
+            PostingGroup(post.id, author_name=post.author, subreddit_name=post.subreddit_name, posts=posts))
 
-    for row in rs:
-        logger.debug(",".join((row[0], row[1], row[2], row[3], row[4], row[5])))
+    for row in rows:
+        logger.debug(",".join(str(x) for x in row[0:6]))
         post_ids = row[1].replace("ma:", "").split(',')
-        posts = []
-        for post_id in post_ids:
-            # print(f"\t{post_id}")
-            posts.append(wd.s.query(SubmittedPost).get(post_id))
+        posts = [posts_by_id.get(post_id) for post_id in post_ids]
 
         last_post = posts[-1]
         assert isinstance(last_post, SubmittedPost)
@@ -608,6 +794,9 @@ def look_for_rule_violations3(wd):
     logger.debug(f"done")
 
     # Go through posting group
+    reviewed_posts = []  # to hand back to the frequency engine once statuses are settled
+    wd.exemption_stats.clear()
+    prefetched = 0
     for i, pg in enumerate(posting_groups):
         logger.debug(
             f"========================{i + 1}/{len(posting_groups)}=================================")
@@ -637,6 +826,9 @@ def look_for_rule_violations3(wd):
         posts_to_verify = []
         logger.debug(f"/r/{pg.subreddit_name}---max_count: {max_count}, interval: {tr_sub.min_post_interval_txt} "
               f"grace_period: {tr_sub.grace_period}")
+        # load stale statuses/flairs for the whole group in one request rather than post by post below
+        prefetched += prefetch_exemption_inputs(wd, [post for post in pg.posts
+                                                     if isinstance(post, SubmittedPost) and not post.reviewed])
         for j, post in enumerate(pg.posts):
             try:
                 assert (isinstance(post, SubmittedPost))  #Assertion error
@@ -694,7 +886,7 @@ def look_for_rule_violations3(wd):
         back_posts = wd.s.query(SubmittedPost) \
             .filter(
             # SubmittedPost.flagged_duplicate.is_(False), # redundant with new flag
-            SubmittedPost.subreddit_name.ilike(tr_sub.subreddit_name),
+            SubmittedPost.subreddit_name == tr_sub.subreddit_name,
             SubmittedPost.time_utc > pg.posts[0].time_utc - tr_sub.min_post_interval + tr_sub.grace_period,
             SubmittedPost.time_utc < pg.posts[-1].time_utc,  # posts not after last post in question
             SubmittedPost.author == pg.author_name,
@@ -703,6 +895,7 @@ def look_for_rule_violations3(wd):
             .all()
 
         possible_pre_posts = []
+        reviewed_posts += pg.posts + back_posts
         logger.debug(f"Found {len(back_posts)} backposts")
         if len(back_posts) == 0:
             # if pg.posts[-1].counted_status <2:   # This doesn't make sense?? what was this supposed to do
@@ -715,6 +908,8 @@ def look_for_rule_violations3(wd):
 
         # Check backposts
         logger.debug("reviwing back posts")
+        prefetched += prefetch_exemption_inputs(wd, [post for post in back_posts if post.counted_status_enum in
+                                                     (CountedStatus.NOT_CHKD, CountedStatus.PREV_EXEMPT)])
         for j, post in enumerate(back_posts):
             logger.debug(f"{i}-{j} Backpost: {post.time_utc} url:{post.get_url()}  title:{post.title[0:30]}"
                         f"\t counted_status: {post.counted_status_enum} posted_status: {post.posted_status} ")
@@ -733,6 +928,7 @@ def look_for_rule_violations3(wd):
                 logger.debug(f"\t..exempting ")
 
         # Go through left over posts
+        wd.ri.get_posted_statuses(possible_pre_posts, get_removed_info=True)
         grace_count = 0
         for j, post in enumerate(posts_to_verify):
             logger.debug(f"{i}-{j} Reviewing: r/{pg.subreddit_name}  {pg.author_name}  {post.time_utc}  "
@@ -782,8 +978,8 @@ def look_for_rule_violations3(wd):
                 notification_text = f"Hall pass was used by {subreddit_author.author_name}: http://redd.it/{post.id}"
                 # REDDIT_CLIENT.redditor(BOT_OWNER).message(pg.subreddit_name, notification_text)
 
-                wd.ri.send_modmail(subreddit=tr_sub, subject="[Notification]  Hall pass was used",
-                                   body=notification_text)
+                queue_modmail(wd, tr_sub, f"{post.id}-hallpass", "[Notification]  Hall pass was used",
+                              notification_text)
                 # tr_sub.send_modmail(subject="[Notification]  Hall pass was used", body=notification_text)
                 post.counted_status_enum = CountedStatus.HALLPASS
                 wd.s.add(subreddit_author)
@@ -802,7 +998,14 @@ def look_for_rule_violations3(wd):
             wd.s.add(post)
         wd.s.commit()
 
+    if engine:
+        for post in reviewed_posts:
+            if isinstance(post, SubmittedPost):
+                engine.sync_post(post)
+        engine.prune(wd.sub_dict)
     wd.s.commit()
+    logger.info(f"exemption checks: {wd.exemption_stats['local']} decided locally, "
+                f"{wd.exemption_stats['api']} needed api ({prefetched} post(s) prefetched in batches)")
 
 
 
@@ -821,10 +1024,11 @@ def do_requested_action_for_valid_reposts(tr_sub: TrackedSubreddit, recent_post:
         if message is True:
             message = "Repost that violates rules: [{title}]({url}) by [{author}](/u/{author})"
         # send_modmail_populate_tags(tr_sub, message, recent_post=recent_post, prev_post=possible_repost, )
-        logger.debug("sending modmail notification)")
-        wd.ri.send_modmail(subreddit=tr_sub,
-                           body=tr_sub.populate_tags(message, recent_post=recent_post, prev_post=possible_repost),
-                           subject="[Notification] Post that violates rule frequency restriction", use_same_thread=True)
+        logger.debug("queueing modmail notification)")
+        queue_modmail(wd, tr_sub, f"{recent_post.id}-violation",
+                      "[Notification] Post that violates rule frequency restriction",
+                      tr_sub.populate_tags(message, recent_post=recent_post, prev_post=possible_repost),
+                      use_same_thread=True)
     if tr_sub.action == "remove":
         recent_post.counted_status_enum = CountedStatus.NEED_REMOVE
         logger.debug(f"Post marked for removal {recent_post.subreddit_name} {recent_post.id} {recent_post.author}")
@@ -833,20 +1037,19 @@ def do_requested_action_for_valid_reposts(tr_sub: TrackedSubreddit, recent_post:
 
 
     if tr_sub.action == "report":
-        logger.debug("reporting post")
+        logger.debug("queueing report")
         if tr_sub.report_reason:
             rp_reason = tr_sub.populate_tags(tr_sub.report_reason, recent_post=recent_post, prev_post=possible_repost)
-            wd.ri.get_submission_api_handle(recent_post).report(f"{bot_name}: {rp_reason}"[0:99])
+            reason = f"{bot_name}: {rp_reason}"[0:99]
         else:
-            wd.ri.get_submission_api_handle(recent_post).report(f"{bot_name}: repeatedly exceeding posting threshold")
-    if tr_sub.message and recent_post.author and wd.ri.get_submission_api_handle(recent_post).author:
-        try:
-            wd.ri.get_submission_api_handle(
-                recent_post).author.message("Regarding your post", tr_sub.populate_tags(tr_sub.message,
-                                                                                        recent_post=recent_post,
-                                                                                        post_list=most_recent_reposts))
-        except (praw.exceptions.APIException, prawcore.exceptions.Forbidden):
-            logger.debug("\tcould not send message")
+            reason = f"{bot_name}: repeatedly exceeding posting threshold"
+        enqueue_action(wd, "report", recent_post.id, tr_sub.subreddit_name, post_id=recent_post.id, reason=reason)
+    if tr_sub.message and recent_post.author:
+        # a deleted account fails in the queue instead of costing a lookup here
+        enqueue_action(wd, "message", f"{recent_post.id}-violation", tr_sub.subreddit_name,
+                       author=recent_post.author, subject="Regarding your post",
+                       body=tr_sub.populate_tags(tr_sub.message, recent_post=recent_post,
+                                                 post_list=most_recent_reposts))
 
 
 
@@ -858,9 +1061,12 @@ def check_for_actionable_violations(tr_sub: TrackedSubreddit, recent_post: Submi
         # SubmittedPost.flagged_duplicate.is_(True),
         SubmittedPost.counted_status_enum == CountedStatus.FLAGGED,
         SubmittedPost.author == recent_post.author,
-        SubmittedPost.subreddit_name.ilike(tr_sub.subreddit_name),
+        SubmittedPost.subreddit_name == tr_sub.subreddit_name,
         SubmittedPost.time_utc < recent_post.time_utc) \
         .all()
+    if REDDITPOST_PARTITIONING:  # older violations may have gone to the archive with their partition
+        other_spam_by_author += archived_violations(wd, tr_sub.subreddit_name, recent_post.author,
+                                                    recent_post.time_utc)
 
     logger.info("Author {0} had {1} rule violations. Banning if at least {2} - query time took: {3}"
                 .format(recent_post.author, len(other_spam_by_author), tr_sub.ban_threshold_count,
@@ -879,25 +1085,19 @@ def check_for_actionable_violations(tr_sub: TrackedSubreddit, recent_post: Submi
         return
 
     if len(other_spam_by_author) == tr_sub.ban_threshold_count - 1 and tr_sub.ban_threshold_count > 1:
-        try:
-            # tr_sub.ignore_AutoModerator_removed
-
-            wd.ri.reddit_client.redditor(recent_post.author).message(
-                subject=f"Beep! Boop! Please note that you are close approaching "
-                        f"your posting limit for {recent_post.subreddit_name}",
-                message=
-                f"This subreddit (/r/{recent_post.subreddit_name}) only allows {tr_sub.max_count_per_interval} post(s) "
-                f"per {humanize.precisedelta(tr_sub.min_post_interval)}. "
-                f"This {'does NOT' if tr_sub.ignore_moderator_removed else 'DOES'} include mod-removed posts. "
-                f"While this post was within the post limiting rule and not removed by this bot, "
-                f"please do not make any new posts before "
-                f"{most_recent_reposts[0].time_utc + tr_sub.min_post_interval} UTC, as it "
-                f"may result in a ban. If you made a title mistake you have "
-                f"STRICTLY {humanize.precisedelta(tr_sub.grace_period)} to delete it and repost it. "
-                f"This is an automated message. "
-            )
-        except praw.exceptions.APIException:
-            pass
+        enqueue_action(
+            wd, "message", f"{recent_post.id}-warning", tr_sub.subreddit_name, author=recent_post.author,
+            subject=f"Beep! Boop! Please note that you are close approaching "
+                    f"your posting limit for {recent_post.subreddit_name}",
+            body=f"This subreddit (/r/{recent_post.subreddit_name}) only allows {tr_sub.max_count_per_interval} post(s) "
+                 f"per {humanize.precisedelta(tr_sub.min_post_interval)}. "
+                 f"This {'does NOT' if tr_sub.ignore_moderator_removed else 'DOES'} include mod-removed posts. "
+                 f"While this post was within the post limiting rule and not removed by this bot, "
+                 f"please do not make any new posts before "
+                 f"{most_recent_reposts[0].time_utc + tr_sub.min_post_interval} UTC, as it "
+                 f"may result in a ban. If you made a title mistake you have "
+                 f"STRICTLY {humanize.precisedelta(tr_sub.grace_period)} to delete it and repost it. "
+                 f"This is an automated message. ")
 
     if len(other_spam_by_author) >= tr_sub.ban_threshold_count:
         num_days = tr_sub.ban_duration_days
@@ -919,69 +1119,51 @@ def check_for_actionable_violations(tr_sub: TrackedSubreddit, recent_post: Submi
                       f"from you that went beyond the limit: {str_prev_posts} If you think you may have been hacked, " \
                       f"please change your passwords NOW. "
         time_next_eligible = datetime.now(pytz.utc) + timedelta(days=num_days)
+        if tr_sub.ban_duration_days > 998:
+            # Only do a 2 week ban if specified permanent ban
+            time_next_eligible = datetime.now(pytz.utc) + timedelta(days=999)
+        elif tr_sub.ban_duration_days == 0:
+            # Only do a 2 week ban if specified permanent ban
+            time_next_eligible = datetime.now(pytz.utc) + timedelta(days=14)
 
         # If banning is specified but not enabled, just go to blacklist. Don't bother trying to ban without access.
         if tr_sub.ban_ability == -2:
-            if tr_sub.ban_duration_days > 998:
-                # Only do a 2 week ban if specified permanent ban
-                time_next_eligible = datetime.now(pytz.utc) + timedelta(days=999)
-            elif tr_sub.ban_duration_days == 0:
-                # Only do a 2 week ban if specified permanent ban
-                time_next_eligible = datetime.now(pytz.utc) + timedelta(days=14)
-
             soft_blacklist(tr_sub, recent_post, time_next_eligible, wd=wd)
             return
 
-        try:
-            if num_days == 999:
-                # Permanent ban
-                wd.ri.reddit_client.subreddit(tr_sub.subreddit_name).banned.add(
-                    recent_post.author, note="ModhelpfulBot: repeated spam", ban_reason="MHB: posting too much",
-                    ban_message=ban_message[:999])
-                logger.info(f"PERMANENT ban for {recent_post.author} succeeded ")
-            else:
-                # Not permanent ban
-                ban_message += f"\n\nYour ban will last {num_days} day{'s' if num_days > 1 else ''} from this message. " \
-                               f"**Repeat infractions result in a permanent ban!**"
-
-                wd.ri.reddit_client.subreddit(tr_sub.subreddit_name).banned.add(
-                    recent_post.author, note="ModhelpfulBot: repeated spam", ban_message=ban_message[:999],
-                    ban_reason="MHB: posting too much",
-                    duration=num_days)
-                logger.info(f"Ban for {recent_post.author} succeeded for {num_days} days")
-        except praw.exceptions.APIException:
-            pass
-        except prawcore.exceptions.Forbidden:
-
-            logger.info("Ban failed - no access?")
-            tr_sub.ban_ability = -2
-            if tr_sub.notify_about_spammers:
-                response_lines = [
-                    "This person has multiple rule violations. "
-                    "Please adjust my privileges and ban threshold "
-                    "if you would like me to automatically ban them.\n\n".format(
-                        recent_post.author, len(other_spam_by_author), tr_sub.ban_threshold_count)]
-
-                for post in other_spam_by_author:
-                    response_lines.append(f"* {post.time_utc}: "
-                                          f"[{post.author}](/u/{post.author}) "
-                                          f"[{post.title}]({post.get_comments_url()})\n")
-                response_lines.append(f"* {recent_post.time_utc}: "
-                                      f"[{recent_post.author}](/u/{recent_post.author}) "
-                                      f"[{recent_post.title}]({recent_post.get_comments_url()})\n")
-
-                # send_modmail_populate_tags(tr_sub, "\n\n".join(response_lines), recent_post=recent_post, prev_post=possible_repost)
-                wd.ri.send_modmail(subreddit=tr_sub, subject="[Notification] Multiple post frequency violations",
-                                   body=tr_sub.populate_tags2("\n\n".join(response_lines),
-                                                              recent_post=recent_post, prev_post=possible_repost))
-            if tr_sub.ban_duration_days > 998:
-                # Only do a 2-week ban if specified permanent ban
-                time_next_eligible = datetime.now(pytz.utc) + timedelta(days=999)
-            elif tr_sub.ban_duration_days == 0:
-                # Only do a 2-week ban if specified permanent ban
-                time_next_eligible = datetime.now(pytz.utc) + timedelta(days=14)
-
-            soft_blacklist(tr_sub, recent_post, time_next_eligible, wd=wd)
+        if num_days != 999:
+            # Not permanent ban
+            ban_message += f"\n\nYour ban will last {num_days} day{'s' if num_days > 1 else ''} from this message. " \
+                           f"**Repeat infractions result in a permanent ban!**"
+
+        # what to do instead if the ban is forbidden - see on_action_failed
+        notify_body = None
+        if tr_sub.notify_about_spammers:
+            response_lines = [
+                "This person has multiple rule violations. "
+                "Please adjust my privileges and ban threshold "
+                "if you would like me to automatically ban them.\n\n".format(
+                    recent_post.author, len(other_spam_by_author), tr_sub.ban_threshold_count)]
+
+            for post in other_spam_by_author:
+                response_lines.append(f"* {post.time_utc}: "
+                                      f"[{post.author}](/u/{post.author}) "
+                                      f"[{post.title}]({post.get_comments_url()})\n")
+            response_lines.append(f"* {recent_post.time_utc}: "
+                                  f"[{recent_post.author}](/u/{recent_post.author}) "
+                                  f"[{recent_post.title}]({recent_post.get_comments_url()})\n")
+
+            # send_modmail_populate_tags(tr_sub, "\n\n".join(response_lines), recent_post=recent_post, prev_post=possible_repost)
+            notify_body = tr_sub.populate_tags2("\n\n".join(response_lines),
+                                                recent_post=recent_post, prev_post=possible_repost)
+
+        enqueue_action(wd, "ban", recent_post.id, tr_sub.subreddit_name, subreddit_name=tr_sub.subreddit_name,
+                       author=recent_post.author, note="ModhelpfulBot: repeated spam",
+                       ban_reason="MHB: posting too much", ban_message=ban_message[:999],
+                       duration=None if num_days == 999 else num_days,  # none = permanent
+                       post_id=recent_post.id, notify_body=notify_body,
+                       blacklist_until=time_next_eligible.isoformat())
+        logger.info(f"Ban for {recent_post.author} queued for {'PERMANENT' if num_days == 999 else num_days} days")
 
 
 def make_comment(subreddit: TrackedSubreddit, recent_post: SubmittedPost, most_recent_reposts, comment_template: String,
@@ -1047,6 +1229,51 @@ def soft_blacklist(tr_sub: TrackedSubreddit, recent_post: SubmittedPost, time_ne
 from workingdata import WorkingData
 
 
+def schedule_next_config_check(tr_sub: TrackedSubreddit, spread=False):
+    # jittered so subs drift apart over the day instead of all coming due together
+    interval = timedelta(hours=SUBWIKI_CHECK_INTERVAL_HRS)
+    if spread:  # first schedule: anywhere in the next interval
+        tr_sub.config_next_check = datetime.now() + interval * random.random()
+    else:
+        tr_sub.config_next_check = datetime.now() + interval * (1 + random.uniform(-CONFIG_CHECK_JITTER,
+                                                                                   CONFIG_CHECK_JITTER))
+
+
+def config_check_due(tr_sub: TrackedSubreddit, intensity=0) -> bool:
+    if intensity == 3 or not tr_sub.mod_list or not tr_sub.config_last_checked:
+        return True
+    if not tr_sub.config_next_check:
+        schedule_next_config_check(tr_sub, spread=True)
+    return tr_sub.config_next_check <= datetime.now()
+
+
+def refresh_sub_config(wd, tr_sub: TrackedSubreddit, full=False) -> (bool, str, bool):
+    """Re-reads a sub's config from reddit, returns (worked, status, fetched).
+
+    Unless full, or the last full fetch is older than CONFIG_FULL_REFRESH_DAYS, the config's wiki page revision
+    is checked first: if it's the one already stored, the mod list, page probes and yaml parse are skipped.
+    """
+    now = datetime.now()
+    if not full and tr_sub.settings_wiki_page and tr_sub.settings_revision_date and tr_sub.mod_list \
+            and tr_sub.last_updated and tr_sub.last_updated > now - timedelta(days=CONFIG_FULL_REFRESH_DAYS):
+        revision_date = wd.ri.get_wiki_revision_date(tr_sub.subreddit_name, tr_sub.settings_wiki_page)
+        if revision_date is not None and int(revision_date) == tr_sub.settings_revision_date:
+            tr_sub.config_last_checked = now
+            schedule_next_config_check(tr_sub)
+            wd.s.add(tr_sub)
+            if tr_sub.settings_yaml is None:  # stored text not loaded yet in this process
+                worked, status = tr_sub.reload_yaml_settings()
+                return worked, status, False
+            return True, "unchanged", False
+
+    sub_info = wd.ri.get_subreddit_info(subreddit_name=tr_sub.subreddit_name)
+    worked, status = tr_sub.update_from_subinfo(sub_info)  # repopulate db with new values/settings from sub
+    tr_sub.config_last_checked = now  # this should be UTC... need to fix
+    schedule_next_config_check(tr_sub)
+    wd.s.add(tr_sub)
+    return worked, status, True
+
+
 def get_subreddit_by_name(wd: WorkingData, subreddit_name: str, create_if_not_exist=True, update_if_due=False):
     # check if tr_sub already loaded in memory
     tr_sub: TrackedSubreddit = wd.sub_dict.get(subreddit_name)
@@ -1076,14 +1303,10 @@ def get_subreddit_by_name(wd: WorkingData, subreddit_name: str, create_if_not_ex
             print(f"GSBN: subreddit doesn't exist  {sub_info}")
             return None
 
-    # Update from scratch if it has been a while
-    if not tr_sub.config_last_checked or tr_sub.config_last_checked < datetime.now() - timedelta(hours=SUBWIKI_CHECK_INTERVAL_HRS):
+    # Update from the wiki if it's due (only refetched if the page has changed)
+    if config_check_due(tr_sub):
         print(f"GSBN: needs update {tr_sub.subreddit_name}")
-        sub_info = wd.ri.get_subreddit_info(subreddit_name=tr_sub.subreddit_name)
-
-        worked, status = tr_sub.update_from_subinfo(sub_info)
-        tr_sub.config_last_checked = datetime.now()  #this should be UTC... need to fix
-        wd.s.add(tr_sub)
+        worked, status, _ = refresh_sub_config(wd, tr_sub)
 
     else:  # or just load from database
         worked, status = tr_sub.reload_yaml_settings()
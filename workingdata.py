@@ -1,11 +1,31 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
 class WorkingData:
     sub_list = []
     s = None
     to_update_list = True
     ri = None
+    frequency_engine = None  # FrequencyEngine unless FREQUENCY_ENGINE_MODE == "off"
+    ari = None  # AsyncRedditInterface when REDDIT_BACKEND == "async"
+    purge_job = None  # ChunkedPurge when PURGE_MODE == "chunked"
     sub_dict = {}
     nsfw_monitoring_subs = {}
 
     def __init__(self):
+        # check_for_post_exemptions decisions: "local" from stored columns, "api" needed a reddit refresh
+        self.exemption_stats = Counter()
+        # sub_list -> newest created_utc ingested from its /new listing, where the next scan can stop
+        self.listing_marks = {}
+        self.pools = {}  # name -> ThreadPoolExecutor, see worker_pool
 
-        pass
+    def worker_pool(self, name: str, max_workers: int) -> ThreadPoolExecutor:
+        # kept for the life of the lane, so its threads - and the praw client each one makes - are reused
+        pool = self.pools.get(name)
+        if not pool:
+            pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name,
+                                      initializer=self.ri.init_worker,
+                                      initargs=(self.ri.rate_limiter.current_priority(),))
+            self.pools[name] = pool
+        return pool
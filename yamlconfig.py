@@ -0,0 +1,28 @@
+import hashlib
+import json
+
+import yaml
+
+# libyaml's loader when pyyaml was built against it, several times faster than the pure python one
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_ERRORS = (yaml.scanner.ScannerError, yaml.composer.ComposerError, yaml.parser.ParserError)
+SETTINGS_JSON_MAX_BYTES = 65535  # UnicodeText is a mysql TEXT column
+
+
+def load_yaml(text: str):
+    return yaml.load(text, Loader=YAML_LOADER)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def to_settings_json(settings) -> str:
+    # None when json can't hold the parsed yaml exactly (dates, sets, non-str keys) - those just get reparsed
+    try:
+        blob = json.dumps(settings, separators=(",", ":"))
+    except (TypeError, ValueError):
+        return None
+    if len(blob.encode("utf-8")) > SETTINGS_JSON_MAX_BYTES or json.loads(blob) != settings:
+        return None
+    return blob